@@ -3,267 +3,1617 @@
 # Copyright (C) 2017 Olaf Lessenich
 
 import argparse
+import base64
+import collections
+import copy
 import csv
+import fcntl
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
 import os
+import queue
+import random
+import re
+import shlex
+import shutil
+import socket
+import socketserver
+import sqlite3
 import sys
 import tempfile
 import time
 import signal
 import statistics
+import threading
+import math
+import zipfile
 import psutil
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from contextlib import redirect_stderr, redirect_stdout
 from plumbum import colors
 from plumbum import local
-from plumbum.cmd import grep
-from plumbum.commands.processes import ProcessExecutionError
 from xml.etree import ElementTree as ET
-from subprocess import TimeoutExpired
+from git_preparemerge import (BLOBS, TRACE, Filter, Job, MergeCommits, State,
+                              Workspace, get_git_conflicts, make_cmd, prepare,
+                              print_forks)
+from jdime_stats import t_quantile
 
 
 GIT = local['git']
 STRATEGY = '$$STRATEGY$$'
-COLS = ['project', 'timestamp', 'merge', 'left', 'right', 'file', 'mergetype',
-        'strategies', 'target', 'cmd', 'loc_in']
+MODES = 'structured,linebased'
+server = None
+timeouts = None
+cache = None
+workspace = None
+progress = None
+isolation = None
+columnar = None
+OUTPUTCOLS = ['project', 'timestamp', 'mergecommit', 'left', 'right', 'file',
+              'mergetype', 'strategy', 'conflicts', 'clines', 'ctokens',
+              'parsed_conflicts', 'runtime', 't_merge', 't_parse',
+              't_semistructure', 't_LinebasedStrategy',
+              't_SemiStructuredStrategy', 't_StructuredStrategy', 'loc_in',
+              'loc_out', 'jdimeversion']
+REGIONCOLS = ['cleft', 'cright', 'csizes']
+SERVERCOLS = ['jvm']
+RUSAGECOLS = ['maxrss', 'utime', 'stime', 'nvcsw', 'nivcsw', 'read_bytes',
+              'write_bytes']
+TIMEOUTCOLS = ['timeout', 'status']
+SAMPLECOLS = ['stratum', 'weight']
+GITCOLS = ['git_conflicts']
+ISOLATIONCOLS = ['env', 'disturbed', 'interference']
+STATSCOLS = ['runtime_mean', 'runtime_stdev', 'runtime_min', 'runtime_max',
+             'runtime_median', 'runs']
+# all other columns are numbers
+TEXTCOLS = ['project', 'timestamp', 'mergecommit', 'left', 'right', 'file',
+            'mergetype', 'strategy', 'jdimeversion', 'csizes', 'jvm', 'status',
+            'stratum', 'env', 'interference']
+CONFLICT_MARKER = re.compile(rb'^(<<<<<<<|\|\|\|\|\|\|\||=======|>>>>>>>)',
+                             re.MULTILINE)
 
 def kill(proc_pid):
-    process = psutil.Process(proc_pid)
-    for proc in process.children(recursive=True):
-        proc.kill()
+    try:
+        process = psutil.Process(proc_pid)
+        for proc in process.children(recursive=True):
+            proc.kill()
         process.kill()
+    except psutil.NoSuchProcess:
+        pass
 
-def get_merge_commits(before):
-    if before:
-        return GIT['rev-list', '--all', '--merges', '--reverse',
-                   '--before', before]().splitlines()
-    else:
-        return GIT['rev-list', '--all', '--merges', '--reverse']().splitlines()
+class Repetitions:
+    """How often each merge is run for benchmarks.
 
-def get_jobs(target, strategies=None, jdimeopts=None, noop=False, statedir=None, commits=[]):
-    options = ["-o", target]
-    if strategies:
-        options.append("-m")
-        options.append(','.join(strategies))
-    if noop:
-        options.append("-n")
-    if jdimeopts:
-        options.append("-j")
-        options.append(jdimeopts)
-    if statedir:
-        options.append("-s")
-        options.append(statedir)
-    return csv.DictReader(iter(GIT['preparemerge', options, commits]()\
-                               .splitlines()), delimiter=';', fieldnames=COLS)
-
-def count_conflicts(merged_file):
-    conflicts = 0
+    After `warmup` discarded runs, a merge is repeated `runs` times. If
+    `ciwidth` is set, repetitions stop early once at least `minruns` runs
+    were made and the confidence interval of the mean runtime is narrower
+    than `ciwidth` times the mean (on either side).
+    """
+
+    def __init__(self, runs=1, warmup=0, minruns=3, ciwidth=None,
+                 confidence=0.95):
+        self.runs = runs
+        self.warmup = warmup
+        self.minruns = max(minruns, 2)
+        self.ciwidth = ciwidth
+        self.confidence = confidence
+
+    def enough(self, runtimes):
+        n = len(runtimes)
+        if n >= self.runs:
+            return True
+        if not self.ciwidth or n < self.minruns:
+            return False
+        mean = statistics.mean(runtimes)
+        t = t_quantile(1 - (1 - self.confidence) / 2, n - 1)
+        return t * statistics.stdev(runtimes) / math.sqrt(n) <= self.ciwidth * mean
+
+def cost(strategy):
+    """Rank a strategy, or a combination of strategies, by its expense."""
+    ranks = {'linebased': 1, 'semistructured': 2, 'structured': 3}
+    return sum(ranks.get(s, 3) for s in strategy.split('+'))
+
+class Timeouts:
+    """How long each merge may run.
+
+    Every run is limited to `limit` seconds. With `factor`, the strategies
+    of a file are run from the cheapest to the most expensive one, and the
+    limit of a strategy is predicted as `factor` times the slowest runtime
+    of the cheaper ones. With `perloc`, the limit is predicted as `perloc`
+    seconds per line of input. Predictions never go below `minimum`.
+
+    Strategies that are known to time out on a file are run as usual,
+    skipped, or limited to `minimum` seconds, if `slow` is 'run', 'skip'
+    or 'cap', respectively. A strategy is only done with a file once it
+    timed out twice, so a later run applies this to the first timeout.
+    With `budget`, runs stop once that many seconds have passed.
+    """
+
+    def __init__(self, limit=1800, minimum=60, factor=None, perloc=None,
+                 slow='run', budget=None):
+        self.limit = limit
+        self.minimum = min(minimum, limit)
+        self.factor = factor
+        self.perloc = perloc
+        self.slow = slow
+        # monotonic time is shared by all processes, including workers
+        self.deadline = time.monotonic() + budget if budget else None
+
+    def order(self, strategies):
+        if not self.factor:
+            return strategies
+        return sorted(strategies, key=cost)
+
+    def predict(self, strategy, loc_in, runtimes, known=None):
+        """Return the limit of a strategy, or None if it is skipped.
+
+        `runtimes` are the runtimes of strategies already run on the same
+        file, `known` the timeout the strategy ran into before, if any.
+        """
+        if known is not None and self.slow == 'skip':
+            return None
+        if known is not None and self.slow == 'cap':
+            return self.minimum
+        predictions = []
+        if self.perloc:
+            predictions.append(self.perloc * loc_in)
+        if self.factor:
+            cheaper = [t for s, t in runtimes.items() if cost(s) < cost(strategy)]
+            if cheaper:
+                predictions.append(self.factor * max(cheaper))
+        if not predictions:
+            return self.limit
+        return min(self.limit, max(self.minimum, max(predictions)))
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def exhausted(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def cap(self, limit):
+        """Cut a limit down to the remaining budget."""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return min(limit, remaining)
+
+def runtime_stats(runtimes):
+    return {'runtime_mean': statistics.mean(runtimes),
+            'runtime_stdev': statistics.stdev(runtimes) if len(runtimes) > 1 else '',
+            'runtime_min': min(runtimes),
+            'runtime_max': max(runtimes),
+            'runtime_median': statistics.median(runtimes),
+            'runs': len(runtimes)}
+
+def usage_stats(usages):
+    """Summarize the resource usage of several runs.
+
+    Reports the peak of the maximum resident set size and the median of
+    everything else.
+    """
+    stats = {}
+    for col in RUSAGECOLS:
+        values = [usage[col] for usage in usages if col in usage]
+        if not values:
+            continue
+        if col == 'maxrss':
+            stats[col] = max(values)
+        else:
+            stats[col] = statistics.median(values)
+    return stats
+
+def get_cores(spec):
+    """Return the cores of a list like 0,2-3."""
+    cores = set()
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        cores.update(range(int(first), int(last or first) + 1))
+    return cores
+
+class Isolation:
+    """Keeps other processes from disturbing the timings of jdime.
+
+    jdime and its descendants run only on `cores` (all cores if not given),
+    with niceness `nice`. Before each run, the cores have to be idle: if
+    one of them is more than `busy` percent busy, or the load average
+    exceeds the number of cores of the machine, the run waits a second and
+    checks again, up to `retries` times. What still interferes after that
+    is reported for the run, as is a frequency governor other than
+    performance.
+    """
+
+    def __init__(self, cores=None, nice=-10, busy=10, retries=3):
+        self.cores = set(cores) if cores else os.sched_getaffinity(0)
+        self.nice = nice
+        self.busy = busy
+        self.retries = retries
+        self.env = None
+        current = os.getpriority(os.PRIO_PROCESS, 0)
+        if nice < current:
+            # raising the niceness again is always allowed
+            try:
+                os.setpriority(os.PRIO_PROCESS, 0, nice)
+                os.setpriority(os.PRIO_PROCESS, 0, current)
+            except PermissionError:
+                print('Not allowed to run jdime at nice %d, keeping %d' %
+                      (nice, current), file=sys.stderr)
+                self.nice = current
+
+    def command(self, exe):
+        """Return `exe` wrapped to run on the cores, at our niceness.
+
+        taskset and nice apply both before exec, so every thread the JVM
+        starts inherits them.
+        """
+        current = os.getpriority(os.PRIO_PROCESS, 0)
+        cores = ','.join(str(core) for core in sorted(self.cores))
+        return local['taskset']['-c', cores, 'nice', '-n',
+                                self.nice - current, exe]
+
+    def governors(self):
+        governors = set()
+        for core in self.cores:
+            try:
+                with open('/sys/devices/system/cpu/cpu%d/cpufreq/'
+                          'scaling_governor' % core) as f:
+                    governors.add(f.read().strip())
+            except OSError:
+                # no frequency scaling, e.g., in virtual machines
+                governors.add('none')
+        return governors
+
+    def interference(self):
+        """Return what keeps the cores from being idle right now."""
+        reasons = []
+        usage = psutil.cpu_percent(interval=0.1, percpu=True)
+        if max(usage[core] for core in self.cores) > self.busy:
+            reasons.append('busy')
+        if os.getloadavg()[0] > os.cpu_count():
+            reasons.append('load')
+        return reasons
+
+    def wait(self):
+        """Wait for the cores to become idle, return what interferes."""
+        reasons = self.interference()
+        for i in range(self.retries):
+            if not reasons:
+                break
+            time.sleep(1)
+            reasons = self.interference()
+        if self.governors() - {'performance', 'none'}:
+            reasons.append('governor')
+        return reasons
+
+    def fingerprint(self):
+        """Describe the machine and the settings that jdime runs with."""
+        if self.env is None:
+            model = os.uname().machine
+            try:
+                with open('/proc/cpuinfo') as f:
+                    for line in f:
+                        if line.startswith('model name'):
+                            model = ' '.join(line.split(':', 1)[1].split())
+                            break
+            except OSError:
+                pass
+            self.env = ('host:%s cpu:%s kernel:%s mem:%dM cores:%d nice:%d '
+                        'governor:%s' %
+                        (socket.gethostname(), model, os.uname().release,
+                         psutil.virtual_memory().total // 1024 ** 2,
+                         len(self.cores), self.nice,
+                         ','.join(sorted(self.governors()))))
+            self.env = self.env.replace(';', ',')
+        return self.env
+
+def timeouted(timeout):
+    return ('Timeouted after %d seconds.\r\n' % (timeout)).encode("utf-8")
+
+class JDimeServer:
+    """A long-lived JDime JVM that merges scenarios sent over its stdin.
+
+    A request is a line with the number of arguments of a jdime
+    invocation, followed by the arguments, each terminated by NUL. The server answers with a line holding
+    the return code and the lengths of stdout and stderr, followed by the
+    contents of both. The server has to exit once its stdin is closed.
+    scripts/jdime-server is such a server.
+    """
+
+    def __init__(self, cmd, warmup=0):
+        self.cmd = cmd
+        self.warmup = warmup
+        self.proc = None
+        self.cold = True
+
+    def start(self, args, timeout):
+        exe = isolation.command(self.cmd[0]) if isolation else \
+            local[self.cmd[0]]
+        self.proc = exe[self.cmd[1:]].popen(stderr=None)
+        self.cold = True
+        for i in range(self.warmup):
+            ret, stdout, stderr, runtime, jvm, usage = self.request(args, timeout)
+            if ret == -5:
+                break
+
+    def communicate(self, args, response):
+        request = '%d\n' % len(args) + ''.join(arg + '\0' for arg in args)
+        self.proc.stdin.write(request.encode('utf-8'))
+        self.proc.stdin.flush()
+        header = self.proc.stdout.readline().split()
+        if len(header) == 3:
+            ret, outlen, errlen = [int(x) for x in header]
+            response['stdout'] = self.proc.stdout.read(outlen)
+            response['stderr'] = self.proc.stdout.read(errlen)
+            response['ret'] = ret
+
+    def request(self, args, timeout):
+        """Send a merge request, return (ret, stdout, stderr, runtime, jvm, usage).
+
+        The resources used by a single request are unknown, so usage is
+        always empty.
+        """
+        if not self.proc:
+            self.start(args, timeout)
+            if not self.proc:
+                # timeout during warm-up
+                return (-5, '', timeouted(timeout), timeout, 'cold', {})
+
+        jvm = 'cold' if self.cold else 'warm'
+        response = {}
+        t0 = time.perf_counter()
+        client = threading.Thread(target=self.communicate,
+                                  args=(args, response))
+        client.start()
+        client.join(timeout)
+        t1 = time.perf_counter()
+
+        if client.is_alive():
+            self.stop()
+            client.join()
+            return (-5, '', timeouted(timeout), t1 - t0, jvm, {})
+        if 'ret' not in response:
+            self.stop()
+            return (-6, '', 'JDime server terminated unexpectedly.\r\n'.encode("utf-8"), t1 - t0, jvm, {})
+
+        self.cold = False
+        return (response['ret'], response['stdout'], response['stderr'],
+                t1 - t0, jvm, {})
+
+    def stop(self):
+        if self.proc:
+            kill(self.proc.pid)
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def close(self):
+        if self.proc:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+class ResultCache:
+    """Results of successful merges, stored by the blob ids of their inputs.
+
+    A result is found by the blob ids of the left, base and right input,
+    the strategy, the jdime version and the jdime options. It holds the
+    csv columns of the merge and, with `output`, the merged file. Once the
+    cache grows beyond `maxsize` bytes, the least recently used results
+    are evicted.
+    """
+
+    def __init__(self, cachedir, maxsize, version, jdimeopts, output=False):
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir)
+        self.path = os.path.join(cachedir, 'results.sqlite')
+        self.maxsize = maxsize
+        self.version = version
+        self.jdimeopts = jdimeopts or ''
+        self.output = output
+        self.counts = collections.Counter()
+        # opened on first use, so that every worker has a connection of its own
+        self.db = None
+
+    def connect(self):
+        if not self.db:
+            self.db = sqlite3.connect(self.path, timeout=600,
+                                      isolation_level=None)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                            '(key TEXT PRIMARY KEY, result TEXT, output BLOB, '
+                            'size INTEGER, used REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS results_used '
+                            'ON results (used)')
+            # the total size of all results, kept up to date by put()
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta '
+                            '(name TEXT PRIMARY KEY, value INTEGER)')
+            self.db.execute("INSERT OR IGNORE INTO meta SELECT 'size', "
+                            "COALESCE(SUM(size), 0) FROM results")
+        return self.db
+
+    def key(self, blobs, strategy):
+        fields = [blob or '' for blob in blobs]
+        fields += [strategy, self.version, self.jdimeopts]
+        return hashlib.sha256('\0'.join(fields).encode('utf-8')).hexdigest()
+
+    def get(self, blobs, strategy):
+        """Return the columns and merged output of a result, or (None, None)."""
+        db = self.connect()
+        key = self.key(blobs, strategy)
+        found = db.execute('SELECT result, output FROM results WHERE key = ?',
+                           (key,)).fetchone()
+        if not found:
+            self.counts['misses'] += 1
+            return (None, None)
+        self.counts['hits'] += 1
+        db.execute('UPDATE results SET used = ? WHERE key = ?',
+                   (time.time(), key))
+        return (json.loads(found[0]), found[1])
+
+    def put(self, blobs, strategy, result, outfile):
+        db = self.connect()
+        data = json.dumps(result)
+        output = None
+        if self.output and os.path.exists(outfile):
+            with open(outfile, 'rb') as merged:
+                output = merged.read()
+        size = len(data) + (len(output) if output else 0)
+        key = self.key(blobs, strategy)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            replaced = db.execute('SELECT size FROM results WHERE key = ?',
+                                  (key,)).fetchone()
+            db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                       (key, data, output, size, time.time()))
+            total = self.grow(size - (replaced[0] if replaced else 0))
+            if total > self.maxsize:
+                self.evict(total)
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def grow(self, delta):
+        """Add delta to the total size of all results, return the total."""
+        self.db.execute("UPDATE meta SET value = value + ? WHERE name = 'size'",
+                        (delta,))
+        return self.db.execute("SELECT value FROM meta "
+                               "WHERE name = 'size'").fetchone()[0]
+
+    def evict(self, total):
+        # make some room, so that not every new result evicts another one
+        excess = total - self.maxsize * 0.9
+        evicted = []
+        freed = 0
+        for key, size in self.db.execute('SELECT key, size FROM results '
+                                         'ORDER BY used'):
+            if freed >= excess:
+                break
+            evicted.append((key,))
+            freed += size
+        self.db.executemany('DELETE FROM results WHERE key = ?', evicted)
+        self.grow(-freed)
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+class RecordingWriter:
+    """Passes csv rows on to `writer` and keeps them in `rows`, too."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.fieldnames = writer.fieldnames
+        self.rows = []
+
+    def writeheader(self):
+        self.writer.writeheader()
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.rows.append({col: row.get(col) for col in self.fieldnames})
 
+class ColumnarSink:
+    """Passes csv rows on to `writer` and stores them in chunk files, too.
+
+    Every `size` rows, a chunk <directory>/<project>.<time>.<pid>.<n>.npz
+    is written, with a numpy array per column. Numbers are stored as
+    floats, with NaN for empty values.
+    """
+
+    def __init__(self, writer, directory, project, size=10000):
+        self.writer = writer
+        self.fieldnames = writer.fieldnames
+        self.directory = directory
+        self.prefix = '%s.%d.%d' % (project, time.time(), os.getpid())
+        self.size = size
+        self.chunks = 0
+        self.rows = []
+        os.makedirs(directory, exist_ok=True)
+
+    def writeheader(self):
+        self.writer.writeheader()
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.add([row])
+
+    def add(self, rows):
+        """Store rows that another writer printed, e.g., one of a worker."""
+        for row in rows:
+            self.rows.append([row.get(col) for col in self.fieldnames])
+        if len(self.rows) >= self.size:
+            self.save()
+
+    def save(self):
+        if not self.rows:
+            return
+        values = list(zip(*self.rows))
+        arrays = {}
+        for i, col in enumerate(self.fieldnames):
+            if col in TEXTCOLS:
+                arrays[col] = numpy.array(['' if v is None else str(v)
+                                           for v in values[i]], dtype=str)
+            else:
+                arrays[col] = numpy.array([to_float(v) for v in values[i]])
+        path = os.path.join(self.directory, '%s.%d.npz' % (self.prefix,
+                                                          self.chunks))
+        # the same format as numpy.savez_compressed, which cannot store a
+        # column named 'file'; readers only see complete chunks
+        with zipfile.ZipFile(path + '.tmp', 'w', zipfile.ZIP_DEFLATED) as chunk:
+            for col, array in arrays.items():
+                with chunk.open(col + '.npy', 'w') as f:
+                    numpy.lib.format.write_array(f, array)
+        os.replace(path + '.tmp', path)
+        self.chunks += 1
+        self.rows = []
+
+    def close(self):
+        self.save()
+
+def to_float(value):
     try:
-        m1 = int(grep['-c', '-e', '^<<<<<<<', merged_file]().strip())
-        m2 = int(grep['-c', '-e', '^=======', merged_file]().strip())
-        m3 = int(grep['-c', '-e', '^>>>>>>>', merged_file]().strip())
-        conflicts = min(m1, m2, m3)
-    except ProcessExecutionError:
-        pass
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+def hms(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return '%d:%02d:%02d' % (minutes // 60, minutes % 60, seconds)
+
+class Progress:
+    """Reports how fast merge scenarios are run and how long the rest takes.
+
+    `total` is the number of merge commits, if known.
+    """
+
+    def __init__(self, total=None):
+        self.total = total
+        self.start = time.monotonic()
+        self.commits = 0
+        self.scenarios = 0
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def rate(self):
+        """Return the merge scenarios run per minute."""
+        return 60 * self.scenarios / max(self.elapsed(), 1e-9)
+
+    def eta(self):
+        if not self.total or not self.commits:
+            return None
+        return self.elapsed() / self.commits * (self.total - self.commits)
+
+    def commit(self, scenarios):
+        """Count a merge commit that is done, with its merge scenarios."""
+        self.commits += 1
+        self.scenarios += scenarios
+        line = '[%d' % self.commits
+        if self.total:
+            line += '/%d' % self.total
+        line += ' commits] %.1f scenarios/min' % self.rate()
+        eta = self.eta()
+        if eta is not None:
+            line += ', ETA %s' % hms(eta)
+        print(line, file=sys.stderr)
+
+    def summary(self, phases, jdime):
+        """Print where the time went.
+
+        `phases` maps the traced phases to their number and total duration,
+        `jdime` each traced process to the time it spent in jdime.
+        """
+        print('%-16s %8s %10s %10s' % ('phase', 'count', 'total[s]',
+                                       'mean[ms]'), file=sys.stderr)
+        for name, (count, total) in sorted(phases.items(),
+                                           key=lambda p: -p[1][1]):
+            print('%-16s %8d %10.2f %10.2f' % (name, count, total,
+                                               1000 * total / count),
+                  file=sys.stderr)
+
+        elapsed = self.elapsed()
+        print('%d merge commits, %d merge scenarios in %s (%.1f scenarios/min)'
+              % (self.commits, self.scenarios, hms(elapsed), self.rate()),
+              file=sys.stderr)
+        # the time of all workers that was not spent in jdime
+        merging = sum(jdime.values())
+        workers = len(jdime)
+        if merging:
+            print('Overhead ratio: %.2f (%.1f s of %d workers spent outside '
+                  'of jdime, %.1f s in jdime)' %
+                  ((elapsed * workers - merging) / merging,
+                   elapsed * workers - merging, workers, merging),
+                  file=sys.stderr)
+
+def read(stream, output, key):
+    output[key] = stream.read()
+
+def reap(pid, output):
+    output['status'] = os.wait4(pid, 0)
+
+def execute(exe, args, timeout):
+    """Run jdime, return (ret, stdout, stderr, runtime, jvm, usage).
+
+    The runtime is wall-clock time. Usage holds the resources used by the
+    process and its descendants, as reported by wait4(2).
+    """
+    if server:
+        return server.request(args, timeout)
+
+    t0 = time.perf_counter()
+    # ret, stdout, stderr = local[exe][args].run(retcode=None)
+    cmd = isolation.command(exe) if isolation else local[exe]
+    p = cmd[args].popen()
+    p.stdin.close()
+    output = {}
+    readers = [threading.Thread(target=read, args=(p.stdout, output, 'stdout')),
+               threading.Thread(target=read, args=(p.stderr, output, 'stderr'))]
+    # reap the child ourselves, as only wait4 tells its resource usage
+    waiter = threading.Thread(target=reap, args=(p.pid, output))
+    for thread in readers + [waiter]:
+        thread.start()
+    waiter.join(timeout)
+    t1 = time.perf_counter()
+    timedout = waiter.is_alive()
+    if timedout:
+        kill(p.pid)
+    for thread in readers + [waiter]:
+        thread.join()
+
+    pid, status, rusage = output['status']
+    p.returncode = os.waitstatus_to_exitcode(status)
+    usage = {'maxrss': rusage.ru_maxrss,
+             'utime': rusage.ru_utime,
+             'stime': rusage.ru_stime,
+             'nvcsw': rusage.ru_nvcsw,
+             'nivcsw': rusage.ru_nivcsw,
+             'read_bytes': rusage.ru_inblock * 512,
+             'write_bytes': rusage.ru_oublock * 512}
+
+    if timedout:
+        return (-5, '', timeouted(timeout), t1 - t0, 'cold', usage)
+    return (p.returncode, output['stdout'], output['stderr'], t1 - t0, 'cold',
+            usage)
+
+def get_jobs(target, strategies=None, jdimeopts=None, noop=False, state=None,
+             commits=[], select=None, meta=None, clean=None):
+    if not strategies:
+        strategies = ['structured']
+    return prepare(commits, target, strategies, jdimeopts, noop, state,
+                   workspace, select, meta, clean)
 
-    return conflicts
+def classify(merges, first=False):
+    """Add the files git merges with conflicts to the metadata of `merges`.
 
-def run(job, prune, writer, runs=1, srcfile=None, noop=False):
+    All merge commits are merged by git at once. With `first`, the merge
+    commits with conflicts are moved to the front.
+    """
+    merges = list(merges)
+    # octopus merges are left to prepare()
+    pairs = [meta for commit, meta in merges if len(meta['parents']) == 2]
+    for meta, conflicts in zip(pairs, get_git_conflicts(
+            [tuple(meta['parents']) for meta in pairs])):
+        meta['conflicts'] = conflicts
+    if first:
+        merges.sort(key=lambda merge: not merge[1].get('conflicts'))
+    return merges
+
+def stratum(job):
+    """Return the merge type and order of magnitude of the input of a job."""
+    return '%s/<%d' % (job.mergetype, 10 ** len(str(job.loc_in)))
+
+def sample_size(population, fraction, precision, confidence):
+    """Return how many scenarios of a stratum to sample.
+
+    With `precision`, enough to estimate a proportion, like the share of
+    conflicting files, within +/- `precision` at the given confidence.
+    """
+    n = 0
+    if fraction:
+        n = math.ceil(fraction * population)
+    if precision:
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        # the worst case of p(1 - p), with a finite population correction
+        n0 = z * z * 0.25 / precision ** 2
+        n = max(n, math.ceil(n0 / (1 + (n0 - 1) / population)))
+    # at least two, to estimate the variance within the stratum
+    return min(population, max(n, 2))
+
+def sample(merges, target, strategies, jdimeopts, noop, state, select,
+           fraction, precision, confidence, seed, clean=None):
+    """Draw a stratified random sample of the merge scenarios of `merges`.
+
+    All merged files that match `select` are classified first, without
+    writing anything, into strata by merge type and lines of input.
+    Returns the merge commits that have scenarios in the sample, as
+    (commit, jobs) pairs. Each job knows its stratum and the number of
+    scenarios of the stratum that it stands for. `clean` is passed on to
+    prepare().
+    """
+    counting = Filter(min_loc=0)
+    if select:
+        counting = Filter(select.files, select.min_loc or 0, select.max_loc,
+                          select.mergetype)
+    population = collections.defaultdict(list)
+    metas = []
+    for commit, meta in merges:
+        metas.append((commit, meta))
+        for job in prepare([commit], target, strategies, jdimeopts, True,
+                           select=counting, meta=meta):
+            population[stratum(job)].append((job.merge, job.file))
+
+    # the same seed draws the same sample, so that -s can resume it
+    rng = random.Random(seed)
+    chosen = {}
+    for name in sorted(population):
+        scenarios = population[name]
+        n = sample_size(len(scenarios), fraction, precision, confidence)
+        for scenario in rng.sample(scenarios, n):
+            chosen[scenario] = (name, len(scenarios) / n)
+    print('Sampled %d of %d merge scenarios in %d strata' %
+          (len(chosen), sum(len(p) for p in population.values()),
+           len(population)), file=sys.stderr)
+
+    paths = collections.defaultdict(set)
+    for merge, file in chosen:
+        paths[merge].add(file)
+
+    def jobs(commit, meta):
+        for job in get_jobs(target, strategies, jdimeopts, noop, state,
+                            [commit], Filter(paths=paths[commit]), meta,
+                            clean):
+            job.stratum, job.weight = chosen[(job.merge, job.file)]
+            yield job
+
+    return [(commit, jobs(commit, meta)) for commit, meta in metas
+            if commit in paths]
+
+def scan_output(merged_file):
+    """Count lines and conflict markers of a merged file in a single pass.
+
+    Returns a dict with the number of conflicts (parsed_conflicts), the
+    number of lines (loc_out), and the lines in the left and right halves
+    of the conflicts, in total (cleft, cright) and per conflict (csizes).
+    """
+    try:
+        with open(merged_file, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        content = b''
+
+    markers = collections.Counter()
+    sizes = []
+    lineno = 0
+    pos = 0
+    start = None
+    for m in CONFLICT_MARKER.finditer(content):
+        lineno += content.count(b'\n', pos, m.start())
+        pos = m.start()
+        marker = m.group(1)
+        markers[marker] += 1
+        if marker == b'<<<<<<<':
+            start = lineno
+            left = None
+        elif start is None:
+            continue
+        elif marker == b'|||||||':
+            left = lineno - start - 1
+        elif marker == b'=======':
+            if left is None:
+                left = lineno - start - 1
+            start = lineno
+        else:
+            if left is not None:
+                sizes.append((left, lineno - start - 1))
+            start = None
+
+    return {'parsed_conflicts': min(markers[b'<<<<<<<'], markers[b'======='],
+                                    markers[b'>>>>>>>']),
+            'loc_out': content.count(b'\n'),
+            'cleft': sum(l for l, r in sizes),
+            'cright': sum(r for l, r in sizes),
+            'csizes': ','.join('%d/%d' % size for size in sizes)}
+
+def parse_statistics(stdout, outfile):
+    """Return the csv columns of a successful merge."""
+    tree = ET.fromstring(stdout)
+    stats = {}
+    stats['conflicts'] = int(tree.find("./mergescenariostatistics/conflicts").text)
+    stats['clines'] = int(tree.find('./mergescenariostatistics/lineStatistics').attrib['numOccurInConflict'])
+    stats['ctokens'] = int(tree.find('./mergescenariostatistics/tokenStatistics').attrib['numOccurInConflict'])
+    stats.update(scan_output(outfile))
+    xmlruntimes={'merge': None,
+                 'parse': None,
+                 'semistructure': None,
+                 'LinebasedStrategy': None,
+                 'SemiStructuredStrategy': None,
+                 'StructuredStrategy': None}
+
+    for e in tree.findall("./mergescenariostatistics/runtime"):
+        for label in xmlruntimes:
+            if label == e.attrib['label']:
+                xmlruntimes[label] = int(e.attrib['timeMS'])
+
+    for label in xmlruntimes:
+        stats['t_' + label] = xmlruntimes[label]
+    return stats
+
+def log_error(errorlog, scenario, cmd, stderr):
+    entry = (80 * '=' + '\r\n' +
+             scenario + '\r\n' +
+             '> %s\r\n' % ' '.join(cmd) +
+             80 * '-' + '\r\n' +
+             stderr.decode("utf-8") +
+             80 * '-' + '\r\n')
+    # parallel workers may fail at the same time
+    with open(errorlog, 'a') as err:
+        fcntl.flock(err, fcntl.LOCK_EX)
+        err.write(entry)
+        fcntl.flock(err, fcntl.LOCK_UN)
+
+def measure(exe, args, outfile, limit, runs):
+    """Run a merge repeatedly, as specified by `runs`.
+
+    Each run is limited to `limit` seconds, or to what is left of the time
+    budget. Returns the output of the last run, the measurements of all
+    runs after the warm-up, what interfered with each of them and, if the
+    budget cut the runs short, the timeout of the last run.
+    """
+    ret, stdout, stderr = None, b'', b''
+    runtimes = []
+    jvms = set()
+    usages = []
+    disturbances = []
+    warmup = runs.warmup
+    timeout = 0
+    # the directory may be gone if a job sharing it was pruned meanwhile
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    while not runtimes or not runs.enough(runtimes):
+        if timeouts.cap(limit) <= 0:
+            return (ret, stdout, stderr, runtimes, jvms, usages,
+                    disturbances, timeout)
+        timeout = timeouts.cap(limit)
+        if os.path.exists(outfile):
+            os.remove(outfile)
+        reasons = []
+        if isolation and not warmup:
+            with TRACE.span('wait', 'isolation'):
+                reasons = isolation.wait()
+        with TRACE.span('jdime', 'jdime', file=outfile):
+            ret, stdout, stderr, t, jvm, usage = execute(exe, args, timeout)
+        if warmup and ret != -5:
+            warmup -= 1
+            continue
+        runtimes.append(t)
+        jvms.add(jvm)
+        usages.append(usage)
+        disturbances.append(reasons)
+        if ret == -5:
+            return (ret, stdout, stderr, runtimes, jvms, usages,
+                    disturbances, timeout if timeout < limit else None)
+    return ret, stdout, stderr, runtimes, jvms, usages, disturbances, None
+
+def run(job, writer, runs=Repetitions(), noop=False, slow=None):
+    """Run all strategies of a job, repeated as specified by `runs`.
+
+    `slow` holds the strategies that timed out on this file before, with
+    their timeouts. Returns whether the job completed without failures and
+    its files may be pruned, the strategies that are done, and the
+    strategies that timed out, with their timeouts.
+    """
 
     if noop:
-        writer = csv.DictWriter(sys.stdout, delimiter=';', fieldnames=COLS)
-        writer.writerow(job)
-        return
+        writer = csv.writer(sys.stdout, delimiter=';')
+        writer.writerow(job.row())
+        return False, [], {}
 
-    project = job['project']
-    timestamp = job['timestamp']
-    mergecommit = job['merge'][0:7]
-    left = job['left'][0:7]
-    right = job['right'][0:7]
-    file = job['file']
-    target = job['target']
-    mergetype = job['mergetype']
-    timeout = 1800
+    project = job.project
+    timestamp = job.timestamp
+    mergecommit = job.merge[0:7]
+    left = job.left[0:7]
+    right = job.right[0:7]
+    file = job.file
+    target = job.target
+    mergetype = job.mergetype
 
     fail = False
+    completed = []
+    timedout = {}
+
+    row = {'project': project,
+           'timestamp': timestamp,
+           'mergecommit': mergecommit,
+           'left': left,
+           'right': right,
+           'file': file,
+           'mergetype': mergetype,
+           'loc_in': job.loc_in,
+           'jdimeversion': jdimeversion,
+           'stratum': job.stratum,
+           'weight': job.weight,
+           'git_conflicts': job.git_conflicts}
 
     if mergetype == "skipped":
-        writer.writerow([project,
-                         timestamp,
-                         mergecommit,
-                         left,
-                         right,
-                         file,
-                         mergetype,
-                         job["cmd"],
-                         '',
-                         '',
-                         '',
-                         '',
-                         '',
-                         '',
-                         '',
-                         '',
-                         '',
-                         '',
-                         '',
-                         job["loc_in"],
-                         0,
-                         jdimeversion])
-        return
+        if not writer:
+            return False, [''], {}
+        row['strategy'] = job.cmd
+        row['loc_out'] = 0
+        writer.writerow(row)
+        return False, [''], {}
 
+    errorlog = os.path.join(target, 'error.log')
+    observed = {}
+    slow = slow or {}
+    for name in timeouts.order(job.strategies.split(',')):
+        strategy = name.replace('+', ',')
+        scenario = '%s %s %s %s %s %s %s %s' % (project, timestamp,
+                                                mergecommit, left, right,
+                                                file, mergetype, strategy)
+        cmd = job.cmd.replace(STRATEGY, strategy).split(' ')
+        exe = cmd[0]
+        args = cmd[1:]
+        outfile = args[7]
 
-    if not srcfile or srcfile == file:
-        errorlog = os.path.join(target, 'error.log')
-        strategies = job['strategies'].split(',')
-        for strategy in strategies:
-            strategy = strategy.replace('+', ',')
-            scenario = '%s %s %s %s %s %s %s %s' % (project, timestamp,
-                                                    mergecommit, left, right,
-                                                    file, mergetype, strategy)
-            cmd = job['cmd'].replace(STRATEGY, strategy).split(' ')
-            exe = cmd[0]
-            args = cmd[1:]
-            outfile = args[7]
-
-            runtimes = []
-            for i in range(runs):
-                if os.path.exists(outfile):
-                    os.remove(outfile)
-                t0 = time.time()
-                # ret, stdout, stderr = local[exe][args].run(retcode=None)
-                p = local[exe][args].popen()
-                try:
-                    stdout, stderr = p.communicate(timeout=timeout)
-                    ret = p.returncode
-                    t1 = time.time()
-                    runtimes.append(t1 - t0)
-                except TimeoutExpired:
-                    kill(p.pid)
-                    stdout = ''
-                    stderr = ('Timeouted after %d seconds.\r\n' % (timeout)).encode("utf-8")
-                    ret = -5
-                    t1 = time.time()
-                    runtimes.append(t1 - t0)
-                    break
+        result = dict(row)
+        result['strategy'] = strategy
+
+        limit = timeouts.predict(name, int(job.loc_in), observed,
+                                 slow.get(name))
+        if limit is None:
+            completed.append(name)
+            if not writer:
+                print('%s: ' % scenario, end='')
+                print(colors.yellow | 'SKIPPED (known to be slow)')
+            else:
+                result['status'] = 'slow'
+                writer.writerow(result)
+            continue
+
+        cached = None
+        if cache and job.blobs:
+            with TRACE.span('cache get', 'cache'):
+                cached, output = cache.get(job.blobs, name)
+        if cached is not None:
+            ret = 0
+            result.update(cached)
+            if output is not None:
+                os.makedirs(os.path.dirname(outfile), exist_ok=True)
+                with open(outfile, 'wb') as merged:
+                    merged.write(output)
+            observed[name] = result['runtime']
+            completed.append(name)
+        else:
+            ret, stdout, stderr, runtimes, jvms, usages, disturbances, cut = \
+                measure(exe, args, outfile, limit, runs)
+            if not runtimes:
+                # the budget was used up before the first run
+                fail = True
+                if not writer:
+                    print('%s: ' % scenario, end='', file=sys.stderr)
+                    print(colors.yellow | 'SKIPPED (out of time budget)',
+                          file=sys.stderr)
+                continue
 
             runtime = statistics.median(runtimes)
+            observed[name] = runtime
+
+            result['runtime'] = runtime
+            result['jvm'] = jvms.pop() if len(jvms) == 1 else 'mixed'
+            result['timeout'] = limit if cut is None else cut
+            result.update(runtime_stats(runtimes))
+            result.update(usage_stats(usages))
+            if isolation:
+                result['env'] = isolation.fingerprint()
+                result['disturbed'] = sum(1 for d in disturbances if d)
+                result['interference'] = ','.join(
+                    sorted(set(itertools.chain(*disturbances))))
+
+            if cut is not None:
+                result['status'] = 'budget'
+            elif ret == -5:
+                result['status'] = 'timeout'
+                timedout[name] = limit
+            elif ret >= 0 and ret <= 127:
+                result['status'] = 'ok'
+            else:
+                result['status'] = 'failed'
+            # the first timeout is left to --known-slow of a later run
+            if cut is None and (ret != -5 or name in slow):
+                completed.append(name)
 
             if ret >= 0 and ret <= 127:
-                tree = ET.fromstring(stdout)
-                conflicts = int(tree.find("./mergescenariostatistics/conflicts").text)
-                clines = int(tree.find('./mergescenariostatistics/lineStatistics').attrib['numOccurInConflict'])
-                ctokens = int(tree.find('./mergescenariostatistics/tokenStatistics').attrib['numOccurInConflict'])
-                parsed_conflicts = count_conflicts(outfile)
-                loc_out = int(local['wc']['-l', outfile]().split(' ')[0])
-                xmlruntimes={'merge': None,
-                             'parse': None,
-                             'semistructure': None,
-                             'LinebasedStrategy': None,
-                             'SemiStructuredStrategy': None,
-                             'StructuredStrategy': None}
-
-                for e in tree.findall("./mergescenariostatistics/runtime"):
-                    for label in xmlruntimes:
-                        if label == e.attrib['label']:
-                            xmlruntimes[label] = int(e.attrib['timeMS'])
+                with TRACE.span('parse', 'parse'):
+                    result.update(parse_statistics(stdout, outfile))
+                if cache and job.blobs and cut is None:
+                    with TRACE.span('cache put', 'cache'):
+                        cache.put(job.blobs, name,
+                                  {col: value
+                                   for col, value in result.items()
+                                   if col not in row and col != 'strategy'},
+                                  outfile)
 
-                if not writer:
-                    print('%s: ' % scenario, end='')
-                    if conflicts > 0:
-                        print(colors.cyan | ('OK (%d conflicts)' % conflicts))
-                    else:
-                        print(colors.green | 'OK')
+        if ret >= 0 and ret <= 127:
+            conflicts = result['conflicts']
+            if not writer:
+                print('%s: ' % scenario, end='')
+                if conflicts > 0:
+                    print(colors.cyan | ('OK (%d conflicts)' % conflicts))
                 else:
-                    writer.writerow([project,
-                                     timestamp,
-                                     mergecommit,
-                                     left,
-                                     right,
-                                     file,
-                                     mergetype,
-                                     strategy,
-                                     conflicts,
-                                     clines,
-                                     ctokens,
-                                     parsed_conflicts,
-                                     runtime,
-                                     xmlruntimes['merge'],
-                                     xmlruntimes['parse'],
-                                     xmlruntimes['semistructure'],
-                                     xmlruntimes['LinebasedStrategy'],
-                                     xmlruntimes['SemiStructuredStrategy'],
-                                     xmlruntimes['StructuredStrategy'],
-                                     job["loc_in"],
-                                     loc_out,
-                                     jdimeversion])
+                    print(colors.green | 'OK')
             else:
-                fail = True
-                if not writer:
-                    print('%s: ' % scenario, end='', file=sys.stderr)
-                    print(colors.red | ('FAILED (%d)' % ret), file=sys.stderr)
-                else:
-                    writer.writerow([project,
-                                     timestamp,
-                                     mergecommit,
-                                     left,
-                                     right,
-                                     file,
-                                     'FAILED (' + str(ret) + ')',
-                                     strategy,
-                                     '',
-                                     '',
-                                     '',
-                                     '',
-                                     runtime,
-                                     '',
-                                     '',
-                                     '',
-                                     '',
-                                     '',
-                                     '',
-                                     job["loc_in"],
-                                     '',
-                                     jdimeversion])
-                with open(errorlog, 'a') as err:
-                    err.write(80 * '=' + '\r\n')
-                    err.write(scenario + '\r\n')
-                    err.write('> %s\r\n' % ' '.join(cmd))
-                    err.write(80 * '-' + '\r\n')
-                    err.writelines(stderr.decode("utf-8"))
-                    err.write(80 * '-' + '\r\n')
-
-    if prune and not fail:
-        for root, dirs, files in os.walk(target, topdown=False):
-            for f in files:
-                path = os.path.join(root, f)
-                if path.endswith(file):
-                    os.remove(path)
-            if not os.listdir(root):
-                os.rmdir(root)
-
-def write_state(project, commit, strategies, statedir):
-    if statedir:
-        statefile = os.path.join(statedir, project)
-        if os.path.exists(statefile):
-            with open(statefile, 'r') as f:
-                for done in csv.DictReader(f, delimiter=';', fieldnames=['project',
-                                                                         'commit',
-                                                                         'strategy']):
-                    if project == done['project'] and commit == done['commit']:
-                        if done['strategy'] in strategies:
-                            strategies.remove(done['strategy'])
-                            if len(strategies) == 0:
-                                return
-
-
-        with open(statefile, 'a') as f:
-            statewriter = csv.writer(f, delimiter=';')
-            for strategy in strategies:
-                statewriter.writerow([project,
-                                      commit,
-                                      strategy])
+                writer.writerow(result)
+        else:
+            fail = True
+            if not writer:
+                print('%s: ' % scenario, end='', file=sys.stderr)
+                print(colors.red | ('FAILED (%d)' % ret), file=sys.stderr)
+            else:
+                result['mergetype'] = 'FAILED (' + str(ret) + ')'
+                writer.writerow(result)
+            log_error(errorlog, scenario, cmd, stderr)
+
+
+    return not fail, completed, timedout
+
+def prune(job):
+    """Remove the files of a job and the directories that become empty."""
+    dirs = set()
+    for path in job.paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        dirs.add(os.path.dirname(path))
+    dirs.add(job.target)
+    # deepest first, so that parents are empty by the time they are visited
+    for d in sorted(dirs, key=len, reverse=True):
+        while d == job.target or d.startswith(job.target + os.sep):
+            try:
+                os.rmdir(d)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                break
+            d = os.path.dirname(d)
+
+def release(scenarios, failed, prune_jobs):
+    """Clean up the merge scenarios of a finished merge commit.
+
+    `scenarios` maps (target, file) to a job of the scenario. Scenarios
+    that did not fail are pruned with `prune_jobs`. Scenarios in the
+    workspace are removed from it, failed ones are copied to the output
+    directory first.
+    """
+    targets = set()
+    with TRACE.span('release', 'fs'):
+        for scenario, job in scenarios.items():
+            if prune_jobs and scenario not in failed:
+                prune(job)
+            if not workspace or not workspace.contains(job.target):
+                continue
+            if scenario in failed:
+                workspace.keep(job)
+            targets.add(job.target)
+        for target in targets:
+            workspace.release(target)
+
+def init_worker(cores, version, servercmd, warmup, limits, results, tracing,
+                isolated):
+    global jdimeversion, server, timeouts, cache, isolation
+    jdimeversion = version
+    timeouts = limits
+    cache = results
+    isolation = isolated
+    if tracing:
+        TRACE.enable()
+    if servercmd:
+        # every worker talks to a JVM of its own
+        server = JDimeServer(servercmd, warmup)
+    if cores is not None:
+        # one core per worker keeps benchmark timings comparable
+        core = cores.get()
+        os.sched_setaffinity(0, {core})
+        if isolation:
+            isolation.cores = {core}
+
+def get_writer(stream, columns):
+    return csv.DictWriter(stream, delimiter=';', fieldnames=columns,
+                          extrasaction='ignore')
+
+def print_output(rows, out, err):
+    """Print the output of a task that was run by a worker."""
+    sys.stdout.write(out)
+    sys.stderr.write(err)
+    sys.stdout.flush()
+    if columnar:
+        columnar.add(rows)
+
+def run_buffered(task):
+    """Run a task in a worker and return its output instead of printing it.
+
+    The csv rows are returned as dicts, too, for the columnar sink.
+    """
+    commit, job, last, columns, runs, slow = task
+    out = io.StringIO()
+    err = io.StringIO()
+    success, completed, timedout = False, [], {}
+    counts = collections.Counter()
+    rows = []
+    if job:
+        before = cache.counts.copy() if cache else counts
+        with redirect_stdout(out), redirect_stderr(err):
+            writer = (RecordingWriter(get_writer(sys.stdout, columns))
+                      if columns else None)
+            success, completed, timedout = run(job, writer, runs, slow=slow)
+        if cache:
+            counts = cache.counts - before
+        if writer:
+            rows = writer.rows
+    return (commit, job, last, success, completed, timedout, counts,
+            TRACE.take(), rows, out.getvalue(), err.getvalue())
+
+def get_tasks(scenarios, inflight, stop, columns, runs, state):
+    """Split the jobs of each merge commit into one task per strategy.
+
+    The last task of every commit is marked, so the caller knows when it
+    may update the state file. At most `inflight` commits are prepared
+    ahead of the results consumed by the caller. Timeouts predicted from
+    cheaper strategies need all strategies of a file in the same task.
+    No more commits are prepared once the time budget is used up.
+    """
+    scenarios = iter(scenarios)
+    while True:
+        inflight.acquire()
+        if stop.is_set() or timeouts.exhausted():
+            return
+        try:
+            commit, jobs = next(scenarios)
+        except StopIteration:
+            return
+        tasks = []
+        for job in jobs:
+            if job.mergetype == 'skipped' or timeouts.factor:
+                tasks.append(job)
+                continue
+            for strategy in job.strategies.split(','):
+                task = copy.copy(job)
+                task.strategies = strategy
+                tasks.append(task)
+
+        if not tasks:
+            yield (commit, None, True, columns, runs, None)
+        for i, job in enumerate(tasks):
+            yield (commit, job, i == len(tasks) - 1, columns, runs,
+                   known_slow(state, job))
+
+def prefetch(scenarios, lookahead):
+    """Prepare merge scenarios in a thread of their own.
+
+    Yields the same (commit, jobs) pairs as `scenarios`, while up to
+    `lookahead` jobs of the next files and merge commits are prepared in
+    the background. Jobs that the caller does not consume are discarded.
+    """
+    ready = queue.Queue(lookahead)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for commit, jobs in scenarios:
+                ready.put(('commit', commit))
+                for job in jobs:
+                    ready.put(('job', job))
+                    if stop.is_set():
+                        return
+            ready.put(('end', None))
+        except Exception as e:
+            ready.put(('error', e))
+
+    def take():
+        kind, value = ready.get()
+        if kind == 'error':
+            raise value
+        return (kind, value)
+
+    def jobs(head):
+        while True:
+            kind, value = take()
+            if kind != 'job':
+                head.append((kind, value))
+                return
+            yield value
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        head = [take()]
+        while head[0][0] == 'commit':
+            kind, commit = head.pop()
+            todo = jobs(head)
+            yield (commit, todo)
+            for job in todo:
+                pass
+    finally:
+        stop.set()
+        # unblock the producer, if it waits for room in the queue
+        while producer.is_alive():
+            try:
+                ready.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+def run_parallel(scenarios, jobs, writer, runs, prune_jobs,
+                 strategies, state):
+    """Run merge scenarios of several commits on a pool of workers.
+
+    Results are printed in the order of the scenarios. CSV rows, state
+    updates and pruning are handled here, in the parent process.
+    """
+    cores = None
+    available = sorted(isolation.cores if isolation
+                       else os.sched_getaffinity(0))
+    if len(available) >= jobs:
+        cores = multiprocessing.Queue()
+        for core in available[:jobs]:
+            cores.put(core)
+
+    inflight = threading.Semaphore(jobs + 1)
+    stop = threading.Event()
+    tasks = get_tasks(scenarios, inflight, stop,
+                      writer.fieldnames if writer else None, runs, state)
+    failed = set()
+    finished = {}
+    servercmd = server.cmd if server else None
+    warmup = server.warmup if server else 0
+    tracing = TRACE.events is not None
+    with multiprocessing.Pool(jobs, init_worker,
+                              (cores, jdimeversion, servercmd, warmup,
+                               timeouts, cache, tracing, isolation)) as pool:
+        results = pool.imap(run_buffered, tasks)
+        try:
+            for (commit, job, last, success, completed, timedout, counts,
+                 events, rows, out, err) in results:
+                if cache:
+                    cache.counts.update(counts)
+                TRACE.add(events)
+                print_output(rows, out, err)
+                if job:
+                    write_state(state, job.merge, completed, job.file, timedout)
+                    commit = job.merge
+                if job and job.mergetype != 'skipped':
+                    scenario = (job.target, job.file)
+                    if not success:
+                        failed.add(scenario)
+                    finished.setdefault(scenario, job)
+                if last:
+                    release(finished, failed, prune_jobs)
+                    if progress:
+                        progress.commit(len(finished))
+                    failed.clear()
+                    finished.clear()
+                    if not timeouts.exhausted():
+                        write_state(state, commit, strategies)
+                    inflight.release()
+        finally:
+            # unblock the task handler, so the pool can shut down
+            stop.set()
+            inflight.release()
+
+def send(address, message):
+    """Send a message to the coordinator and return its answer."""
+    with socket.create_connection(address) as sock:
+        stream = sock.makefile('rwb')
+        stream.write(json.dumps(message).encode('utf-8') + b'\n')
+        stream.flush()
+        return json.loads(stream.readline().decode('utf-8'))
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        message = json.loads(self.rfile.readline().decode('utf-8'))
+        if message['op'] in ('lease', 'renew', 'result'):
+            answer = getattr(self.server, message['op'])(message)
+        else:
+            answer = {}
+        self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+
+class Coordinator(socketserver.ThreadingTCPServer):
+    """Hands out merge scenarios to workers on other hosts, see work().
+
+    Each message is a line of JSON on a connection of its own. A job is
+    leased to a worker for `ttl` seconds, along with the contents of its
+    input files, and the worker renews the lease while the job runs. Jobs
+    of expired leases are handed out again, and late results of expired
+    leases are ignored. CSV rows, error logs, state updates and pruning
+    are handled here.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, scenarios, config, prune_jobs, strategies,
+                 state, ttl):
+        socketserver.ThreadingTCPServer.__init__(self, address,
+                                                 CoordinatorHandler)
+        self.scenarios = iter(scenarios)
+        self.config = config
+        self.prune_jobs = prune_jobs
+        self.strategies = strategies
+        self.state = state
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.pending = collections.deque()
+        self.leases = {}
+        self.ids = itertools.count(1)
+        # merge commit -> [unfinished jobs, finished scenarios, failed ones]
+        self.commits = {}
+        self.exhausted = False
+        self.finished = threading.Event()
+
+    def refill(self):
+        """Prepare the next merge commit that has something to run."""
+        while not self.pending and not self.exhausted:
+            if timeouts.exhausted():
+                self.exhausted = True
+                return
+            try:
+                commit, jobs = next(self.scenarios)
+            except StopIteration:
+                self.exhausted = True
+                return
+            dispatched = False
+            for job in jobs:
+                commit = job.merge
+                if job.mergetype == 'skipped':
+                    # nothing to run, no need to bother a worker
+                    result = run_buffered((None, job, False,
+                                           self.config['columns'], None, None))
+                    print_output(*result[-3:])
+                    TRACE.add(result[-4])
+                    write_state(self.state, job.merge, result[4], job.file)
+                    continue
+                dispatched = True
+                self.pending.append(job)
+                self.commits.setdefault(job.merge, [0, {}, set()])[0] += 1
+            if not dispatched:
+                # complete right away, as no result will come in for it
+                if progress:
+                    progress.commit(0)
+                if commit:
+                    write_state(self.state, commit, self.strategies)
+
+    def lease(self, message):
+        with self.lock:
+            now = time.monotonic()
+            for lease, (job, deadline) in list(self.leases.items()):
+                if deadline < now:
+                    print('Lease %d of %s expired' % (lease, job.file),
+                          file=sys.stderr)
+                    del self.leases[lease]
+                    self.pending.appendleft(job)
+            self.refill()
+            if not self.pending:
+                if self.leases:
+                    # a worker may still die and leave its job to others
+                    return {'wait': max(1, self.ttl / 10)}
+                self.finished.set()
+                return {'done': True}
+            job = self.pending.popleft()
+            lease = next(self.ids)
+            self.leases[lease] = (job, now + self.ttl)
+
+        files = {}
+        for path in job.paths:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, job.target)] = \
+                        base64.b64encode(f.read()).decode('ascii')
+        return {'lease': lease,
+                'ttl': self.ttl,
+                'config': self.config,
+                'job': job.row(),
+                'blobs': job.blobs,
+                'paths': job.paths,
+                'files': files,
+                'slow': known_slow(self.state, job),
+                'extra': {'stratum': job.stratum,
+                          'weight': job.weight,
+                          'git_conflicts': job.git_conflicts}}
+
+    def renew(self, message):
+        with self.lock:
+            lease = message['lease']
+            if lease not in self.leases:
+                return {'expired': True}
+            job, deadline = self.leases[lease]
+            self.leases[lease] = (job, time.monotonic() + self.ttl)
+            return {}
+
+    def result(self, message):
+        with self.lock:
+            leased = self.leases.pop(message['lease'], None)
+            if not leased:
+                return {}
+            job = leased[0]
+            print_output(message['rows'], message['out'], message['err'])
+            TRACE.add(message['events'])
+            if message['errors']:
+                with open(os.path.join(job.target, 'error.log'), 'a') as err:
+                    fcntl.flock(err, fcntl.LOCK_EX)
+                    err.write(message['errors'])
+                    fcntl.flock(err, fcntl.LOCK_UN)
+            write_state(self.state, job.merge, message['completed'], job.file,
+                        message['timedout'])
+
+            commit = self.commits[job.merge]
+            scenario = (job.target, job.file)
+            commit[0] -= 1
+            commit[1].setdefault(scenario, job)
+            if not message['success']:
+                commit[2].add(scenario)
+            if commit[0] == 0:
+                unfinished, finished, failed = self.commits.pop(job.merge)
+                release(finished, failed, self.prune_jobs)
+                if progress:
+                    progress.commit(len(finished))
+                if not timeouts.exhausted():
+                    write_state(self.state, job.merge, self.strategies)
+            return {}
+
+def coordinate(address, scenarios, config, prune_jobs, strategies, state,
+               ttl):
+    coordinator = Coordinator(address, scenarios, config, prune_jobs,
+                              strategies, state, ttl)
+    thread = threading.Thread(target=coordinator.serve_forever)
+    thread.start()
+    print('Waiting for workers on %s:%d' % coordinator.server_address,
+          file=sys.stderr)
+    coordinator.finished.wait()
+    coordinator.shutdown()
+    thread.join()
+    coordinator.server_close()
+
+def renew(address, lease, interval, stop):
+    while not stop.wait(interval):
+        try:
+            send(address, {'op': 'renew', 'lease': lease})
+        except OSError:
+            pass
+
+def inside(path, directory):
+    return os.path.normpath(path).startswith(os.path.normpath(directory) +
+                                             os.sep)
+
+def work(address, workdir):
+    """Run the jobs handed out by a coordinator until it is done."""
+    global jdimeversion, timeouts, isolation
+    name = '%s:%d' % (socket.gethostname(), os.getpid())
+    while True:
+        try:
+            answer = send(address, {'op': 'lease', 'worker': name})
+        except ConnectionRefusedError:
+            # the coordinator is gone once all jobs are done
+            return
+        if 'wait' in answer:
+            time.sleep(answer['wait'])
+            continue
+        if 'lease' not in answer:
+            return
+
+        config = answer['config']
+        jdimeversion = config['jdimeversion']
+        timeouts = Timeouts(**config['timeouts'])
+        runs = Repetitions(**config['runs'])
+        if config['trace'] and TRACE.events is None:
+            TRACE.enable()
+        if config['isolation'] and not isolation:
+            # on all cores of this host, unless given with --isolate
+            isolation = Isolation(**config['isolation'])
+
+        # the scenario lives in a directory of our own
+        job = Job(*answer['job'], blobs=answer['blobs'])
+        for slot, value in answer['extra'].items():
+            setattr(job, slot, value)
+        target = os.path.join(workdir, str(answer['lease']))
+        job.paths = [target + path[len(job.target):]
+                     for path in answer['paths']]
+        job.target = target
+        outfile = os.path.join(target, STRATEGY, job.file)
+        files = [os.path.join(target, path) for path in answer['files']]
+        for path in job.paths + files + [outfile]:
+            if not inside(path, target):
+                raise ValueError('Path outside of the scenario: %s' % path)
+        if job.mergetype != 'skipped':
+            # jdime, whatever command the coordinator sent
+            inputs = job.paths[:int(job.mergetype.split('-')[0])]
+            job.cmd = make_cmd(outfile, config['jdimeopts'], inputs)
+        for path, content in answer['files'].items():
+            path = os.path.join(target, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(base64.b64decode(content))
+
+        stop = threading.Event()
+        renewer = threading.Thread(target=renew,
+                                   args=(address, answer['lease'],
+                                         answer['ttl'] / 3, stop))
+        renewer.start()
+        try:
+            (commit, job, last, success, completed, timedout, counts, events,
+             rows, out, err) = run_buffered((None, job, False, config['columns'], runs,
+                                  answer['slow']))
+        finally:
+            stop.set()
+            renewer.join()
+
+        errors = ''
+        errorlog = os.path.join(target, 'error.log')
+        if os.path.exists(errorlog):
+            with open(errorlog, 'r') as f:
+                errors = f.read()
+        shutil.rmtree(target, ignore_errors=True)
+        send(address, {'op': 'result',
+                       'lease': answer['lease'],
+                       'success': success,
+                       'completed': completed,
+                       'timedout': timedout,
+                       'events': events,
+                       'rows': rows,
+                       'out': out,
+                       'err': err,
+                       'errors': errors})
+
+def get_address(address):
+    # only local workers, unless a host is given
+    host, port = (address.rsplit(':', 1) if ':' in address
+                  else ('127.0.0.1', address))
+    return (host, int(port))
+
+def write_state(state, commit, strategies, file='', slow=None):
+    if state and commit:
+        with TRACE.span('state', 'state'):
+            state.mark(commit, strategies, file)
+            if slow:
+                state.mark_slow(commit, file, slow)
+
+def known_slow(state, job):
+    if state:
+        return state.slow(job.merge, job.file)
+    return {}
 
 def main():
-    global jdimeversion
+    global jdimeversion, server, timeouts, cache, workspace, progress
+    global isolation, columnar
     parser = argparse.ArgumentParser()
     parser.add_argument('-o', '--output',
                         help='Store output in this directory',
@@ -271,13 +1621,26 @@ def main():
     parser.add_argument('-m', '--modes',
                         help='Strategies to be prepared, separated by comma',
                         type=str,
-                        default='structured,linebased')
+                        default=MODES)
     parser.add_argument('-j', '--jdimeopts',
                         help='Additional options to pass to jdime',
                         type=str)
     parser.add_argument('-f', '--file',
-                        help='Merge only specified file',
-                        type=str)
+                        help='Merge only files with this path or name, '
+                             'which may be a glob pattern (repeatable)',
+                        action='append')
+    parser.add_argument('--min-loc',
+                        help='Merge only files with at least this many lines '
+                             'of input',
+                        type=int)
+    parser.add_argument('--max-loc',
+                        help='Merge only files with at most this many lines '
+                             'of input',
+                        type=int)
+    parser.add_argument('--mergetype',
+                        help='Merge only files with a base (3-way) or without '
+                             '(2-way)',
+                        choices=['2-way', '3-way'])
     parser.add_argument('-p', '--prune',
                         help='Prune successfully merged scenarios',
                         action="store_true")
@@ -296,76 +1659,417 @@ def main():
     parser.add_argument('-b', '--before',
                         help='Use only commits before <date>',
                         type=str)
+    parser.add_argument('--after',
+                        help='Use only commits after <date>',
+                        type=str)
+    parser.add_argument('--merges',
+                        help='Use only the merge commits listed in this file '
+                             '(full hashes, one per line, - for stdin; '
+                             'needs all)',
+                        type=argparse.FileType('r'))
     parser.add_argument('-r', '--runs',
                         help='Run task this many times (e.g., for benchmarks)',
                         type=int,
                         default=1)
+    parser.add_argument('-w', '--warmup',
+                        help='Discard this many runs before measuring',
+                        type=int,
+                        default=0)
+    parser.add_argument('--min-runs',
+                        help='Run task at least this many times with --ci',
+                        type=int,
+                        default=3)
+    parser.add_argument('--ci',
+                        help='Repeat until the confidence interval of the '
+                             'runtime is within +/- this fraction of the mean, '
+                             'but at most RUNS times',
+                        type=float)
+    parser.add_argument('--confidence',
+                        help='Confidence level for --ci and '
+                             '--sample-precision',
+                        type=float,
+                        default=0.95)
+    parser.add_argument('--stats',
+                        help='Add runtime statistics over all runs to the csv',
+                        action="store_true")
+    parser.add_argument('--rusage',
+                        help='Add peak memory, cpu time, context switches '
+                             'and I/O of jdime to the csv',
+                        action="store_true")
+    parser.add_argument('--isolate',
+                        help='Run jdime only on these cores (e.g., 2,3 or '
+                             '2-3, one per worker with -J, all if empty), '
+                             'once they are idle, and add the machine and '
+                             'interference to the csv',
+                        type=str)
+    parser.add_argument('--nice',
+                        help='Run jdime at this niceness with --isolate',
+                        type=int,
+                        default=-10)
+    parser.add_argument('--max-busy',
+                        help='Wait for the cores of --isolate to be at most '
+                             'this many percent busy before each run',
+                        type=float,
+                        default=10)
+    parser.add_argument('--busy-retries',
+                        help='Check this many more times, a second apart, '
+                             'before a run is taken on busy cores anyway',
+                        type=int,
+                        default=3)
+    parser.add_argument('--timeout',
+                        help='Stop a merge after this many seconds',
+                        type=float,
+                        default=1800)
+    parser.add_argument('--min-timeout',
+                        help='Never predict a timeout below this many seconds',
+                        type=float,
+                        default=60)
+    parser.add_argument('--timeout-factor',
+                        help='Run cheaper strategies first and stop a merge '
+                             'after this many times their runtime',
+                        type=float)
+    parser.add_argument('--timeout-per-loc',
+                        help='Stop a merge after this many seconds per line '
+                             'of input',
+                        type=float)
+    parser.add_argument('--known-slow',
+                        help='Run, skip or cap to --min-timeout the strategies '
+                             'that timed out on a file before (needs -s)',
+                        choices=['run', 'skip', 'cap'],
+                        default='run')
+    parser.add_argument('--budget',
+                        help='Start no merges after this many seconds',
+                        type=float)
+    parser.add_argument('--cache',
+                        help='Reuse results of merges with the same input '
+                             'files, strategy, jdime version and options from '
+                             'this directory',
+                        type=str)
+    parser.add_argument('--cache-size',
+                        help='Evict the least recently used results once the '
+                             'cache exceeds this many MiB',
+                        type=int,
+                        default=1024)
+    parser.add_argument('--cache-output',
+                        help='Keep the merged files in the cache as well',
+                        action="store_true")
+    parser.add_argument('--workspace',
+                        help='Prepare merge scenarios in this directory, '
+                             'e.g., on a tmpfs, and keep only failed ones in '
+                             'the output directory (implies -p)',
+                        type=str)
+    parser.add_argument('--workspace-reserve',
+                        help='Prepare merge scenarios in the output directory '
+                             'once less than this many MiB are free in the '
+                             'workspace',
+                        type=int,
+                        default=64)
+    parser.add_argument('--sample',
+                        help='Run only this fraction of the merge scenarios '
+                             'of all merge commits, drawn at random per '
+                             'merge type and order of magnitude of lines of '
+                             'input',
+                        type=float)
+    parser.add_argument('--sample-precision',
+                        help='Sample enough merge scenarios to estimate the '
+                             'share of conflicting files per stratum within '
+                             '+/- this fraction',
+                        type=float)
+    parser.add_argument('--seed',
+                        help='Seed of the random sample',
+                        type=int,
+                        default=0)
+    parser.add_argument('--git-conflicts',
+                        help='Add the number of conflicts of git\'s own '
+                             'merge of each file to the csv',
+                        action="store_true")
+    parser.add_argument('--conflicting-only',
+                        help='Run strategies other than linebased only on '
+                             'files that git merges with conflicts (implies '
+                             '--git-conflicts)',
+                        action="store_true")
+    parser.add_argument('--conflicting-first',
+                        help='Run the merge commits that git merges with '
+                             'conflicts first (implies --git-conflicts)',
+                        action="store_true")
     parser.add_argument('-t', '--tag',
                         help='Append this tag to each line',
                         type=str)
-    parser.add_argument('commits', default=[], nargs='+')
+    parser.add_argument('--regions',
+                        help='Add the sizes of conflict regions to the csv',
+                        action="store_true")
+    parser.add_argument('--server',
+                        help='Send merges to a long-lived JDime JVM started '
+                             'by this command instead of running jdime',
+                        type=str)
+    parser.add_argument('--server-warmup',
+                        help='Warm up each JDime JVM with this many merges',
+                        type=int,
+                        default=0)
+    parser.add_argument('-l', '--lookahead',
+                        help='Prepare up to this many files ahead in the '
+                             'background while jdime runs',
+                        type=int,
+                        default=0)
+    parser.add_argument('-J', '--jobs',
+                        help='Run this many merge scenarios in parallel, '
+                             'each worker pinned to a core of its own',
+                        type=int,
+                        default=1)
+    parser.add_argument('--coordinator',
+                        help='Hand out merge scenarios to workers that '
+                             'connect to [HOST:]PORT (on 127.0.0.1 if no '
+                             'host is given) instead of running them',
+                        type=str)
+    parser.add_argument('--worker',
+                        help='Run merge scenarios handed out by the '
+                             'coordinator at [HOST:]PORT',
+                        type=str)
+    parser.add_argument('--lease',
+                        help='Hand out the scenarios of workers that have '
+                             'not been heard of for this many seconds again',
+                        type=float,
+                        default=60)
+    parser.add_argument('--columnar',
+                        help='Store the csv lines as numpy arrays in this '
+                             'directory as well (needs -c)',
+                        type=str)
+    parser.add_argument('--trace',
+                        help='Record how long each phase takes to this file, '
+                             'as JSON lines if it ends in .jsonl, else as a '
+                             'Chrome trace, and report the throughput',
+                        type=str)
+    parser.add_argument('-v', '--verbose',
+                        help='Report the number of spawned processes',
+                        action="store_true")
+    parser.add_argument('commits', default=[], nargs='*')
     args = parser.parse_args()
 
+    if args.isolate is not None:
+        cores = get_cores(args.isolate) if args.isolate else None
+        if cores and not cores <= os.sched_getaffinity(0):
+            parser.error('--isolate: not all of these cores are available')
+        if args.jobs > len(cores or os.sched_getaffinity(0)):
+            # workers would share cores and find them busy
+            parser.error('-J: more workers than cores of --isolate')
+        isolation = Isolation(cores, args.nice, args.max_busy,
+                              args.busy_retries)
+        # keep git and ourselves off the cores of jdime
+        others = os.sched_getaffinity(0) - isolation.cores
+        if others:
+            os.sched_setaffinity(0, others)
+
+    if args.worker:
+        if args.server:
+            server = JDimeServer(shlex.split(args.server), args.server_warmup)
+        workdir = args.output or tempfile.mkdtemp(prefix="jdime.")
+        work(get_address(args.worker), workdir)
+        if server:
+            server.close()
+        if not args.output:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return
+    if not args.commits:
+        parser.error('the following arguments are required: commits')
+    if args.trace:
+        TRACE.enable(args.trace)
+
+    sampling = args.sample or args.sample_precision
+    if sampling and args.commits != ['all']:
+        parser.error('--sample and --sample-precision need all')
+    if args.merges and args.commits != ['all']:
+        parser.error('--merges needs all')
+    if args.conflicting_first and args.commits != ['all']:
+        parser.error('--conflicting-first needs all')
+    if args.conflicting_only or args.conflicting_first:
+        args.git_conflicts = True
+
     strategies = args.modes.split(',')
+    timeouts = Timeouts(args.timeout, args.min_timeout, args.timeout_factor,
+                        args.timeout_per_loc, args.known_slow, args.budget)
+
+    if args.columnar and not args.csv:
+        parser.error('--columnar needs -c')
+    if args.columnar and not numpy:
+        parser.error('--columnar needs numpy')
 
     writer = None
     if args.csv:
-        writer = csv.writer(sys.stdout, delimiter=';')
+        outputcols = OUTPUTCOLS.copy()
+        if args.regions:
+            outputcols += REGIONCOLS
+        if args.server:
+            outputcols += SERVERCOLS
+        if args.stats or args.ci:
+            outputcols += STATSCOLS
+        if args.rusage:
+            outputcols += RUSAGECOLS
+        # tells timeouts apart from crashes
+        outputcols += TIMEOUTCOLS
+        if sampling:
+            outputcols += SAMPLECOLS
+        if args.git_conflicts:
+            outputcols += GITCOLS
+        if args.isolate is not None:
+            outputcols += ISOLATIONCOLS
+        writer = get_writer(sys.stdout, outputcols)
+        if args.columnar and not args.noop:
+            # rows of workers are added where their output is printed
+            columnar = writer = ColumnarSink(writer, args.columnar,
+                                             os.path.basename(os.getcwd()))
         if args.header:
-            outputcols = ['project',
-                          'timestamp',
-                          'mergecommit',
-                          'left',
-                          'right',
-                          'file',
-                          'mergetype',
-                          'strategy',
-                          'conflicts',
-                          'clines',
-                          'ctokens',
-                          'parsed_conflicts',
-                          'runtime',
-                          't_merge',
-                          't_parse',
-                          't_semistructure',
-                          't_LinebasedStrategy',
-                          't_SemiStructuredStrategy',
-                          't_StructuredStrategy',
-                          'loc_in',
-                          'loc_out',
-                          'jdimeversion']
-            writer.writerow(outputcols)
+            writer.writeheader()
     if args.output:
         target = args.output
     else:
         target = tempfile.mkdtemp(prefix="jdime.")
 
-    if args.statedir:
-        if not os.path.exists(args.statedir):
-            os.makedirs(args.statedir)
-
     if args.tag:
         jdimeversion = args.tag
     else:
         jdimeversion = local['jdime']['-v']().strip()
     if args.runs > 1:
         jdimeversion += " runs:" + str(args.runs)
+    if args.warmup:
+        jdimeversion += " warmup:" + str(args.warmup)
+    if args.ci:
+        jdimeversion += " ci:%g/%g" % (args.ci, args.confidence)
+    runs = Repetitions(args.runs, args.warmup, args.min_runs, args.ci,
+                       args.confidence)
     # make sure this doesn't interfere with our csv delimiter
     jdimeversion.replace(';', ',')
 
+    if args.server:
+        server = JDimeServer(shlex.split(args.server), args.server_warmup)
+
+    if args.cache and not args.noop:
+        cache = ResultCache(args.cache, args.cache_size * 1024 * 1024,
+                            jdimeversion, args.jdimeopts, args.cache_output)
+
     project = os.path.basename(os.getcwd())
     commits = args.commits
 
+    state = None
+    if args.statedir:
+        state = State(args.statedir, project)
+
+    if args.workspace:
+        args.prune = True
+        workspace = Workspace(args.workspace, project, target,
+                              args.workspace_reserve * 1024 * 1024)
+
+    select = None
+    complete = strategies
+    if (args.file or args.min_loc is not None or args.max_loc is not None or
+            args.mergetype):
+        select = Filter(args.file, args.min_loc, args.max_loc, args.mergetype)
+        # the other files of a merge commit are still to do
+        complete = []
+
+    clean = None
+    if args.git_conflicts:
+        clean = strategies
+        if args.conflicting_only:
+            clean = [strategy for strategy in strategies if cost(strategy) == 1]
+            # the other strategies are still to do on files without conflicts
+            complete = []
+
     if len(commits) == 1 and commits[0] == 'all':
-        for commit in get_merge_commits(args.before):
-            for job in get_jobs(target, strategies, args.jdimeopts, args.noop, args.statedir, [commit,]):
-                run(job, args.prune, writer, args.runs, args.file, args.noop)
-            write_state(project, commit, strategies.copy(), args.statedir)
+        merges = MergeCommits(args.before, args.after,
+                              args.merges.read().splitlines() if args.merges
+                              else None)
+        if args.git_conflicts:
+            merges = classify(merges, args.conflicting_first)
+        if sampling:
+            scenarios = sample(merges, target, strategies, args.jdimeopts,
+                               args.noop, state, select, args.sample,
+                               args.sample_precision, args.confidence,
+                               args.seed, clean)
+            # the scenarios outside of the sample are still to do
+            complete = []
+        else:
+            scenarios = ((commit, get_jobs(target, strategies,
+                                           args.jdimeopts, args.noop, state,
+                                           [commit,], select, meta, clean))
+                         for commit, meta in merges)
+        if args.trace:
+            progress = Progress(len(scenarios) if sampling else len(merges))
     else:
-        for job in get_jobs(target, strategies, args.jdimeopts, args.noop, args.statedir, commits):
-            run(job, args.prune, writer, args.runs, args.file, args.noop)
-        for commit in commits:
-            write_state(project, commit, strategies.copy(), args.statedir)
+        # the merge commit is resolved during preparation
+        scenarios = [(None, get_jobs(target, strategies, args.jdimeopts,
+                                     args.noop, state, commits, select,
+                                     clean=clean))]
+        if args.trace:
+            progress = Progress(1)
+
+    if args.coordinator and not args.noop:
+        config = {'jdimeversion': jdimeversion,
+                  'jdimeopts': args.jdimeopts,
+                  'columns': writer.fieldnames if writer else None,
+                  'runs': vars(runs),
+                  'timeouts': {'limit': timeouts.limit,
+                               'minimum': timeouts.minimum,
+                               'factor': timeouts.factor,
+                               'perloc': timeouts.perloc,
+                               'slow': timeouts.slow},
+                  'trace': bool(args.trace),
+                  'isolation': {'nice': isolation.nice,
+                                'busy': isolation.busy,
+                                'retries': isolation.retries}
+                               if isolation else None}
+        coordinate(get_address(args.coordinator), scenarios, config,
+                   args.prune, complete, state, args.lease)
+    elif args.jobs > 1 and not args.noop:
+        run_parallel(scenarios, args.jobs, writer, runs, args.prune,
+                     complete, state)
+    else:
+        if args.lookahead and not args.noop:
+            scenarios = prefetch(scenarios, args.lookahead)
+        for commit, jobs in scenarios:
+            if timeouts.exhausted():
+                break
+            finished = {}
+            failed = set()
+            for job in jobs:
+                success, completed, timedout = run(job, writer, runs,
+                                                   args.noop,
+                                                   known_slow(state, job))
+                if job.mergetype != 'skipped':
+                    finished[(job.target, job.file)] = job
+                    if not success:
+                        failed.add((job.target, job.file))
+                if not args.noop:
+                    write_state(state, job.merge, completed, job.file,
+                                timedout)
+                commit = job.merge
+            # only now, as the next files may already be prepared meanwhile
+            release(finished, failed, args.prune)
+            if progress:
+                progress.commit(len(finished))
+            if not timeouts.exhausted():
+                write_state(state, commit, complete)
+
+    if server:
+        server.close()
+    if columnar:
+        columnar.close()
+    if progress:
+        progress.summary(TRACE.phases, TRACE.jdime)
+    TRACE.close()
+    if cache:
+        cache.close()
+        print('Result cache: %d hits, %d misses' %
+              (cache.counts['hits'], cache.counts['misses']), file=sys.stderr)
+    if state:
+        state.close()
+    BLOBS.close()
+    if workspace:
+        workspace.collect()
+        if not os.listdir(workspace.scenarios):
+            os.rmdir(workspace.scenarios)
+
+    if args.verbose:
+        print_forks()
 
     if args.prune and os.path.exists(target) and not os.listdir(target):
         os.rmdir(target)
@@ -5,54 +5,646 @@
 import argparse
 import collections
 import csv
+import fnmatch
+import json
+import heapq
 import os
+import re
+import shutil
+import sqlite3
+import subprocess
 import sys
 import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from plumbum import local
 from plumbum.commands.processes import ProcessExecutionError
 
 STRATEGY = '$$STRATEGY$$'
 GIT = local['git']
+FORKS = collections.Counter()
+GIT_MARKER = re.compile(rb'^<<<<<<< ', re.MULTILINE)
+BATCH_HEADER = re.compile(rb'^([0-9a-f]{40,64}) ([a-z]+) ([0-9]+)\n$')
+COLS = ['project', 'timestamp', 'merge', 'left', 'right', 'file', 'mergetype',
+        'strategies', 'target', 'cmd', 'loc_in']
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
+class Tracer:
+    """Records how long the phases of a run take, as Chrome trace events.
+
+    Nothing is recorded unless tracing is enabled. Events are kept until
+    they are taken, or, with a file to trace to, written to it right away,
+    as JSON lines if its name ends in .jsonl, else as a Chrome trace. The
+    number and duration of the events per phase, and the time each
+    process spent in jdime, are summed up as well.
+    """
+
+    def __init__(self):
+        self.events = None
+        self.stream = None
+        self.lock = threading.Lock()
+        self.phases = collections.OrderedDict()
+        self.jdime = collections.Counter()
+
+    def enable(self, path=None):
+        self.events = []
+        # forked workers keep their events for the parent instead
+        self.stream = None
+        if path:
+            # unbuffered, so that forked processes inherit nothing to flush
+            self.stream = open(path, 'wb', buffering=0)
+            self.lines = path.endswith('.jsonl')
+            # a Chrome trace may lack the closing bracket, e.g., on a crash
+            self.separator = '' if self.lines else '[\n'
+
+    @contextmanager
+    def span(self, name, cat, **args):
+        if self.events is None:
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            self.add([{'name': name, 'cat': cat, 'ph': 'X',
+                       'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                       'pid': os.getpid(), 'tid': threading.get_ident(),
+                       'args': args}])
+
+    def add(self, events):
+        """Add events, e.g., the ones recorded by another process."""
+        if self.events is None:
+            return
+        chunks = []
+        with self.lock:
+            for event in events:
+                phase = self.phases.setdefault(event['name'], [0, 0.0])
+                phase[0] += 1
+                phase[1] += event['dur'] / 1e6
+                if event['cat'] == 'jdime':
+                    self.jdime[event['pid']] += event['dur'] / 1e6
+                if self.stream is None:
+                    self.events.append(event)
+                    continue
+                chunks.append(self.separator + json.dumps(event))
+                self.separator = '\n' if self.lines else ',\n'
+            if chunks:
+                self.stream.write(''.join(chunks).encode('utf-8'))
+
+    def take(self):
+        """Return the events kept so far and forget them."""
+        events = self.events or []
+        if self.events is not None:
+            self.events = []
+        return events
+
+    def close(self):
+        if self.stream:
+            self.stream.write(b'\n' if self.lines else b'\n]\n')
+            self.stream.close()
+            self.stream = None
+
+TRACE = Tracer()
+
+def git(*args):
+    FORKS['git ' + args[0]] += 1
+    with TRACE.span('git ' + args[0], 'git'):
+        return GIT[args]()
+
+def print_forks():
+    eprint('%d processes spawned (%s)' %
+           (sum(FORKS.values()),
+            ', '.join('%s: %d' % (cmd, n) for cmd, n in sorted(FORKS.items()))))
+
+class BlobReader:
+    """Reads blobs through a single long-lived `git cat-file --batch`."""
+
+    def __init__(self):
+        self.proc = None
+
+    def read(self, commit, filename):
+        """Return (blob id, content) of a file, or (None, None) if missing.
+
+        Requests end in NUL, so that paths may contain newlines.
+        """
+        if not self.proc:
+            FORKS['git cat-file'] += 1
+            self.proc = GIT['cat-file', '--batch', '-z'].popen(
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None)
+        request = ('%s:%s' % (commit, filename)).encode('utf-8')
+        with TRACE.span('git cat-file', 'git'):
+            self.proc.stdin.write(request + b'\0')
+            self.proc.stdin.flush()
+            header = self.proc.stdout.readline()
+            found = BATCH_HEADER.match(header)
+            if not found:
+                # '<request> missing' or 'ambiguous', which spans as many
+                # lines as the request
+                for i in range(request.count(b'\n')):
+                    self.proc.stdout.readline()
+                return (None, None)
+            blob, objtype, size = found.groups()
+            # the content of other objects is read as well, to stay in sync
+            content = self.proc.stdout.read(int(size))
+            self.proc.stdout.read(1)
+        if objtype != b'blob':
+            return (None, None)
+        return (blob.decode('ascii'), content)
+
+    def close(self):
+        if self.proc:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+BLOBS = BlobReader()
+
+class State:
+    """Completed tasks of a project, stored in the state dir.
+
+    A task is a strategy run on a merge commit. Tasks on single files of a
+    merge commit are recorded as well, so that an interrupted merge commit
+    can be resumed. An empty file name stands for the whole merge commit.
+
+    Strategies that ran into a timeout on a file are remembered together
+    with the timeout, so later runs can skip them or cut them short. A
+    merge commit is not complete for such a strategy until it is done with
+    the file.
+    """
+
+    def __init__(self, statedir, project):
+        if not os.path.exists(statedir):
+            os.makedirs(statedir)
+        self.project = project
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(statedir, 'state.sqlite'),
+                                  timeout=600, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS done '
+                        '(project TEXT, merge TEXT, file TEXT, strategy TEXT, '
+                        'PRIMARY KEY (project, merge, file, strategy)) '
+                        'WITHOUT ROWID')
+        self.db.execute('CREATE TABLE IF NOT EXISTS slow '
+                        '(project TEXT, merge TEXT, file TEXT, strategy TEXT, '
+                        'timeout REAL, '
+                        'PRIMARY KEY (project, merge, file, strategy)) '
+                        'WITHOUT ROWID')
+        self.migrate(os.path.join(statedir, project))
+
+    def migrate(self, statefile):
+        """Import a state file of older versions, which had a line
+        'project;merge;strategy' per completed task."""
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                if os.path.isfile(statefile):
+                    with open(statefile, 'r') as f:
+                        tasks = [(task['project'], task['merge'], '',
+                                  task['strategy']) for task in
+                                 csv.DictReader(f, delimiter=';',
+                                                fieldnames=['project', 'merge',
+                                                            'strategy'])]
+                    self.db.executemany('INSERT OR IGNORE INTO done '
+                                        'VALUES (?, ?, ?, ?)', tasks)
+                    os.rename(statefile, statefile + '.migrated')
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+
+    def done(self, merge, strategy, file=''):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM done WHERE project = ? AND '
+                                   'merge = ? AND file = ? AND strategy = ?',
+                                   (self.project, merge, file,
+                                    strategy)).fetchone() is not None
+
+    def started(self, merge):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM done WHERE project = ? AND '
+                                   'merge = ? LIMIT 1',
+                                   (self.project, merge)).fetchone() is not None
+
+    def mark(self, merge, strategies, file=''):
+        with self.lock:
+            if not file:
+                pending = {strategy for strategy, in self.db.execute(
+                    'SELECT strategy FROM slow WHERE project = ? AND '
+                    'merge = ? AND NOT EXISTS (SELECT 1 FROM done WHERE '
+                    'done.project = slow.project AND done.merge = slow.merge '
+                    'AND done.file = slow.file AND '
+                    'done.strategy = slow.strategy)', (self.project, merge))}
+                strategies = [strategy for strategy in strategies
+                              if strategy not in pending]
+            self.db.executemany('INSERT OR IGNORE INTO done VALUES (?, ?, ?, ?)',
+                                [(self.project, merge, file, strategy)
+                                 for strategy in strategies])
+
+    def slow(self, merge, file):
+        """Return the known-slow strategies of a file and their timeouts."""
+        with self.lock:
+            return dict(self.db.execute('SELECT strategy, timeout FROM slow '
+                                        'WHERE project = ? AND merge = ? AND '
+                                        'file = ?',
+                                        (self.project, merge, file)))
+
+    def mark_slow(self, merge, file, slow):
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO slow '
+                                'VALUES (?, ?, ?, ?, ?)',
+                                [(self.project, merge, file, strategy, timeout)
+                                 for strategy, timeout in slow.items()])
+
+    def close(self):
+        self.db.close()
+
+class Workspace:
+    """A scratch directory for merge scenarios, e.g., on a tmpfs.
+
+    Input files are stored once per blob in `<root>/blobs` and hard-linked
+    into the scenarios in `<root>/<project>`. Once less than `reserve`
+    bytes are free in the file system of the workspace, scenarios are
+    prepared in the output directory instead. Scenarios that are kept for
+    later analysis are copied to the output directory.
+    """
+
+    def __init__(self, root, project, output, reserve=0):
+        self.root = root
+        self.blobs = os.path.join(root, 'blobs')
+        self.scenarios = os.path.join(root, project)
+        self.output = output
+        self.reserve = reserve
+        os.makedirs(self.blobs, exist_ok=True)
+        os.makedirs(self.scenarios, exist_ok=True)
+
+    def free(self):
+        st = os.statvfs(self.root)
+        return st.f_bavail * st.f_frsize
+
+    def full(self):
+        if self.free() >= self.reserve:
+            return False
+        self.collect()
+        return self.free() < self.reserve
+
+    def collect(self):
+        """Remove blobs that are not linked into any scenario."""
+        for entry in os.scandir(self.blobs):
+            if entry.stat().st_nlink == 1:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def scenario(self, target):
+        """Return the workspace directory of a scenario directory."""
+        return os.path.join(self.scenarios, os.path.relpath(target, self.output))
+
+    def contains(self, path):
+        return path.startswith(self.scenarios + os.sep)
+
+    def write(self, path, blob, content):
+        stored = os.path.join(self.blobs, blob)
+        if os.path.lexists(path):
+            os.remove(path)
+        for attempt in range(2):
+            if not os.path.exists(stored):
+                tmp = '%s.%d' % (stored, os.getpid())
+                with open(tmp, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp, stored)
+            try:
+                os.link(stored, path)
+                return
+            except FileNotFoundError:
+                # collected by another process in the meantime
+                continue
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def keep(self, job):
+        """Copy the files of a job and the error log to the output."""
+        for path in job.paths + [os.path.join(job.target, 'error.log')]:
+            if not os.path.exists(path):
+                continue
+            kept = os.path.join(self.output,
+                                os.path.relpath(path, self.scenarios))
+            os.makedirs(os.path.dirname(kept), exist_ok=True)
+            shutil.copyfile(path, kept)
+
+    def release(self, target):
+        shutil.rmtree(target, ignore_errors=True)
+
+class Filter:
+    """Selects the merge scenarios to prepare.
+
+    `files` are paths or glob patterns, which match the path of a file or
+    its name, `paths` are exact paths. `mergetype` is '2-way' or '3-way'.
+    Skipped files are only selected by `files` and `paths`.
+    """
+
+    def __init__(self, files=None, min_loc=None, max_loc=None,
+                 mergetype=None, paths=None):
+        self.files = files
+        self.min_loc = min_loc
+        self.max_loc = max_loc
+        self.mergetype = mergetype
+        self.paths = paths
+
+    def file(self, path):
+        if self.paths is not None and path not in self.paths:
+            return False
+        if not self.files:
+            return True
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatchcase(path, pattern) or
+                   fnmatch.fnmatchcase(name, pattern)
+                   for pattern in self.files)
+
+    def ways(self, lbr, revs):
+        """Match the number of input files of a merged file."""
+        if not self.mergetype:
+            return True
+        ways = sum(1 for key, filename in zip(('left', 'base', 'right'), lbr)
+                   if key in revs and filename)
+        return self.mergetype == '%d-way' % ways
+
+    def counts_loc(self):
+        return self.min_loc is not None or self.max_loc is not None
+
+    def loc(self, loc_in):
+        return ((self.min_loc is None or loc_in >= self.min_loc) and
+                (self.max_loc is None or loc_in <= self.max_loc))
+
+    def skipped(self, path):
+        return self.file(path) and not self.mergetype and not self.counts_loc()
+
+class Job:
+    """A merge scenario of a single file.
+
+    Besides the columns, a job knows the blob ids of its left, base and
+    right input, where available, and the paths of its input and output
+    files. Jobs of a sample know their stratum and sampling weight, and
+    jobs of classified files the number of conflicts of git's merge.
+    """
+
+    __slots__ = COLS + ['blobs', 'paths', 'stratum', 'weight', 'git_conflicts']
+
+    def __init__(self, *values, blobs=None, paths=None):
+        for col, value in zip(COLS, values):
+            setattr(self, col, value)
+        self.blobs = blobs
+        self.paths = paths or []
+        self.stratum = None
+        self.weight = None
+        self.git_conflicts = None
+
+    def row(self):
+        return [getattr(self, col) for col in COLS]
+
+def open_merge_index(gitdir):
+    """Open the index of merge commits by their parent pairs."""
+    db = sqlite3.connect(os.path.join(gitdir, 'jdime-merges.sqlite'),
+                         timeout=600, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute('CREATE TABLE IF NOT EXISTS merges '
+               '(left TEXT, right TEXT, merge TEXT, '
+               'PRIMARY KEY (left, right)) WITHOUT ROWID')
+    db.execute('CREATE TABLE IF NOT EXISTS tips (tip TEXT PRIMARY KEY) '
+               'WITHOUT ROWID')
+    return db
+
+def update_merge_index(db):
+    """Add the merges that are new since the last update to the index."""
+    tips = git('rev-parse', '--all').split()
+    # one writer at a time, the others find the index up to date
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        known = [tip for tip, in db.execute('SELECT tip FROM tips')]
+        if set(tips) != set(known):
+            FORKS['git rev-list'] += 1
+            revs = ''.join('^%s\n' % tip for tip in known)
+            cmd = GIT['rev-list', '--reverse', '--merges', '--parents', '--all',
+                      '--stdin'] << revs
+            try:
+                merges = cmd().splitlines()
+            except ProcessExecutionError:
+                # some of the known tips are gone, start from scratch
+                FORKS['git rev-list'] += 1
+                merges = git('rev-list', '--reverse', '--merges', '--parents',
+                             '--all').splitlines()
+
+            scenarios = [line.split(' ') for line in merges]
+            db.executemany('INSERT OR REPLACE INTO merges VALUES (?, ?, ?)',
+                           [(scenario[1], scenario[2], scenario[0])
+                            for scenario in scenarios if len(scenario) == 3])
+            db.execute('DELETE FROM tips')
+            db.executemany('INSERT INTO tips VALUES (?)',
+                           [(tip,) for tip in set(tips)])
+        db.execute('COMMIT')
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+
+def find_merge(left, right):
+    """Return the merge commit of a left and right parent, or None.
+
+    Lookups are answered from an index of parent pairs in the git dir,
+    which is updated incrementally if a pair is not found.
+    """
+    gitdir = git('rev-parse', '--git-dir').strip()
+    db = open_merge_index(gitdir)
+    try:
+        query = 'SELECT merge FROM merges WHERE left = ? AND right = ?'
+        found = db.execute(query, (left, right)).fetchone()
+        if not found:
+            update_merge_index(db)
+            found = db.execute(query, (left, right)).fetchone()
+        return found[0] if found else None
+    finally:
+        db.close()
+
+class CommitGraph:
+    """The parents and generation numbers of all commits.
+
+    Merge bases are found like git merge-base does, by painting the
+    ancestors of both commits in the order of their generation, until
+    only commits that are ancestors of a common ancestor are left.
+    """
+
+    def __init__(self):
+        self.parents = {}
+        self.generation = {}
+        # parents are listed before their children
+        for line in git('rev-list', '--all', '--topo-order', '--reverse',
+                        '--parents').splitlines():
+            commit, *parents = line.split(' ')
+            self.parents[commit] = parents
+            self.generation[commit] = 1 + max((self.generation[p]
+                                               for p in parents), default=0)
+
+    def merge_bases(self, left, right):
+        """Return the best common ancestors of two commits."""
+        LEFT, RIGHT, STALE = 1, 2, 4
+        if left == right:
+            return [left]
+        flags = {left: LEFT, right: RIGHT}
+        queue = [(-self.generation[left], left),
+                 (-self.generation[right], right)]
+        heapq.heapify(queue)
+        # queued commits that are not ancestors of a common ancestor yet
+        active = 2
+        bases = []
+        while active:
+            g, commit = heapq.heappop(queue)
+            f = flags[commit]
+            if not f & STALE:
+                active -= 1
+                if f & (LEFT | RIGHT) == LEFT | RIGHT:
+                    bases.append(commit)
+                    f |= STALE
+            # children have a higher generation, so no flags come later
+            for parent in self.parents[commit]:
+                old = flags.get(parent)
+                if old is not None and old & f == f:
+                    continue
+                flags[parent] = (old or 0) | f
+                if old is None:
+                    heapq.heappush(queue, (-self.generation[parent], parent))
+                    if not f & STALE:
+                        active += 1
+                elif f & STALE and not old & STALE:
+                    active -= 1
+        return bases
+
+class MergeCommits:
+    """The merge commits of all branches, oldest first.
+
+    Iterating yields each merge commit with what prepare() needs to know
+    about it: its parents, its merge base and its timestamp. All of this
+    is read with two git processes instead of several per merge commit.
+    Only merge commits with more than one best merge base are passed to
+    git merge-base, which picks one of them. With `only`, the merge
+    commits are restricted to these. If all lines of `only` are written
+    by format_merge(), they are taken as they are and no history is read,
+    nor are `before` and `after` applied.
+    """
+
+    def __init__(self, before=None, after=None, only=None):
+        self.bases = None
+        if only is not None:
+            listed = [line.split('\t') for line in only if line.strip()]
+            if listed and all(len(fields) == 4 for fields in listed):
+                self.merges = [fields[:3] for fields in listed]
+                self.bases = {fields[0]: fields[3] or None
+                              for fields in listed}
+                return
+            only = {fields[0].strip() for fields in listed}
+        args = ['log', '--all', '--merges', '--reverse',
+                '--format=%H%x09%P%x09%ci']
+        if before:
+            args += ['--before', before]
+        if after:
+            args += ['--after', after]
+        self.merges = [line.split('\t') for line in git(*args).splitlines()]
+        if only is not None:
+            self.merges = [merge for merge in self.merges if merge[0] in only]
+
+    def __len__(self):
+        return len(self.merges)
+
+    def __iter__(self):
+        graph = None
+        if self.merges and self.bases is None:
+            graph = CommitGraph()
+        for merge, parents, timestamp in self.merges:
+            parents = parents.split(' ')
+            base = None
+            if graph is None:
+                base = self.bases[merge]
+            elif len(parents) == 2:
+                bases = graph.merge_bases(*parents)
+                if len(bases) == 1:
+                    base = bases[0]
+                elif bases:
+                    base = git('merge-base', *parents).strip()
+            yield (merge, {'parents': parents, 'base': base,
+                           'timestamp': timestamp})
+
+def format_merge(merge, info):
+    """Return a line for MergeCommits(only=...) with all it knows of a merge.
+
+    `merge` and `info` are as yielded by MergeCommits.
+    """
+    return '\t'.join([merge, ' '.join(info['parents']), info['timestamp'],
+                      info['base'] or ''])
+
+def get_git_conflicts(merges):
+    """Return the files that git merges with conflicts, per merge.
+
+    `merges` are (left, right) pairs, which are all merged by a single
+    git merge-tree, without touching the work tree. For each merge, the
+    files with conflicts are mapped to their number of conflicts, or to 1
+    for conflicts without conflict markers, e.g., modify/delete.
+    """
+    FORKS['git merge-tree'] += 1
+    pairs = ''.join('%s %s\n' % merge for merge in merges)
+    cmd = GIT['merge-tree', '--stdin', '--name-only', '--no-messages',
+              '--allow-unrelated-histories', '-z'] << pairs
+    with TRACE.span('git merge-tree', 'git', merges=len(merges)):
+        # per merge: status, tree and the files with conflicts
+        tokens = iter(cmd().split('\0'))
+    results = []
+    for status in tokens:
+        if not status:
+            break
+        tree = next(tokens)
+        conflicts = {}
+        for f in iter(lambda: next(tokens), ''):
+            blob, content = BLOBS.read(tree, f)
+            conflicts[f] = max(1, len(GIT_MARKER.findall(content or b'')))
+        results.append(conflicts)
+    return results
+
+def get_changes(a, b):
+    """Return the files added, modified or renamed in `a...b`.
+
+    Returns the set of changed files, the set of added files, and a dict
+    mapping the new names of renamed files to their old names.
+    """
+    files = set()
+    new = set()
+    renamed = {}
+    tokens = iter(git('diff', '-z', '--name-status', '-M', '--diff-filter=AMR',
+                      a + '...' + b).split('\0'))
+    for t in tokens:
+        if not t:
+            break
+        f = next(tokens)
+        if t.startswith('R'):
+            renamed[next(tokens)] = f
+            continue
+        files.add(f)
+        if t == 'A':
+            new.add(f)
+    return (files, new, renamed)
+
 def get_merged_files(revs):
     merged_files = []
     skipped_files = {}
-    modified_lr = GIT['diff', '--name-status', '--diff-filter=AM',
-                   revs['left'] + '...' + revs['right']]().splitlines()
-    modified_rl = GIT['diff', '--name-status', '--diff-filter=AM',
-                   revs['right'] + '...' + revs['left']]().splitlines()
-    left_files = set()
-    right_files = set()
-    left_files_new = set()
-    right_files_new = set()
-    for line in modified_lr:
-        t, f = line.split('\t')[0:2]
-        left_files.add(f)
-        if t == 'A':
-            left_files_new.add(f)
-    for line in modified_rl:
-        t, f = line.split('\t')[0:2]
-        right_files.add(f)
-        if t == 'A':
-            right_files_new.add(f)
-
-    renamed_lr = GIT['diff', '--name-status', '--diff-filter=R',
-                       revs['left'] + '...' + revs['right']]().splitlines()
-    renamed_rl = GIT['diff', '--name-status', '--diff-filter=R',
-                       revs['right'] + '...' + revs['left']]().splitlines()
-    left_renamed = {}
-    right_renamed = {}
-    for line in renamed_lr:
-        old, new = line.split('\t')[1:3]
-        left_renamed[new] = old
-        left_files.add(new)
-    for line in renamed_rl:
-        old, new = line.split('\t')[1:3]
-        right_renamed[new] = old
-        right_files.add(new)
+    left_files, left_files_new, left_renamed = get_changes(revs['left'],
+                                                           revs['right'])
+    right_files, right_files_new, right_renamed = get_changes(revs['right'],
+                                                              revs['left'])
+    left_files.update(left_renamed.keys())
+    right_files.update(right_renamed.keys())
 
     intersection = left_files.intersection(right_files)
     for f in intersection:
@@ -99,60 +691,211 @@ def get_merged_files(revs):
 
     return (merged_files, skipped_files)
 
-def prepare_job(target, revs, lbr, noop=False):
+def prepare_job(target, revs, lbr, strategies, noop=False, workspace=None,
+                select=None):
+    """Write the input files of a merged file.
+
+    Returns None if the scenario does not match the `loc_in` range of
+    `select`; the input files are written only otherwise.
+    """
     l, b, r = lbr
     lpath = os.path.dirname(l)
 
+    keys = ("left", "base", "right")
+    blobs = [None, None, None]
+    contents = [None, None, None]
+    loc_in = 0
+    commits = [ revs[key] if key in revs else None for key in keys ]
+    if not noop or (select and select.counts_loc()):
+        for i, (commit, filename) in enumerate(zip(commits, lbr)):
+            if commit and filename:
+                blobs[i], contents[i] = BLOBS.read(commit, filename)
+                if contents[i] is not None:
+                    loc_in += contents[i].count(b'\n')
+    if select and not select.loc(loc_in):
+        return None
+
     if not noop:
-        for rev in STRATEGIES:
-            os.makedirs(os.path.join(target, rev, lpath), exist_ok=True)
+        for rev in strategies:
+            os.makedirs(os.path.join(target, rev.replace('+', ','), lpath),
+                        exist_ok=True)
 
-    keys = ("left", "base", "right")
     inputfiles = []
-    loc_in = 0
-    for key, commit, filename in zip(keys, [ revs[key] if key in revs else None for key in keys ], lbr):
+    for i, (key, commit, filename) in enumerate(zip(keys, commits, lbr)):
 
         if commit and filename:
             inputfile = os.path.join(target, key, filename)
             if not noop:
                 os.makedirs(os.path.dirname(inputfile), exist_ok=True)
-                try:
-                    with open(inputfile, 'w') as targetfile:
-                        targetfile.write(GIT['show', commit + ":" + filename]())
-                    loc_in += int(local['wc']['-l', inputfile]().split(' ')[0])
-                except ProcessExecutionError:
-                    os.remove(inputfile)
+                if contents[i] is not None:
+                    with TRACE.span('write', 'fs'):
+                        if workspace:
+                            workspace.write(inputfile, blobs[i], contents[i])
+                        else:
+                            with open(inputfile, 'wb') as targetfile:
+                                targetfile.write(contents[i])
 
             inputfiles.append(inputfile)
 
     # return (inputfiles, os.path.join(target, STRATEGY, l))
-    return (inputfiles, l, loc_in)
+    return (inputfiles, l, loc_in, None if noop else tuple(blobs))
+
+def make_cmd(outfile, jdimeopts, inputfiles):
+    """Return the jdime command line of a merge, with STRATEGY to fill in."""
+    if jdimeopts:
+        jdimeopts = '-' + jdimeopts
+    else:
+        jdimeopts = ''
+
+    return 'jdime -eoe -log WARNING -s -m %s -o %s %s %s' % (STRATEGY, outfile,
+                                                             jdimeopts,
+                                                             ' '.join(inputfiles))
 
-def write_job(writer, target, project, timestamp, revs, jdimeopts, inputfiles,
-              outputfile, loc_in, reason=None):
+def make_job(target, project, timestamp, revs, strategies, jdimeopts,
+             inputfiles, outputfile, loc_in, reason=None, blobs=None):
 
     if len(inputfiles) > 0:
         mergetype = ("%d-way" % len(inputfiles))
         outfile = os.path.join(target, STRATEGY, outputfile)
 
-        if jdimeopts:
-            jdimeopts = '-' + jdimeopts
-        else:
-            jdimeopts = ''
-
-        cmd = 'jdime -eoe -log WARNING -s -m %s -o %s %s %s' % (STRATEGY,
-                                                                outfile,
-                                                                jdimeopts,
-                                                                ' '.join(inputfiles))
-        strategies = ','.join(STRATEGIES)
+        cmd = make_cmd(outfile, jdimeopts, inputfiles)
+        paths = inputfiles + [outfile.replace(STRATEGY, s.replace('+', ','))
+                              for s in strategies]
+        strategies = ','.join(strategies)
     else:
         mergetype = "skipped"
         cmd = reason
         target = ""
         strategies = ""
+        paths = []
+
+    return Job(project, timestamp, revs['merge'], revs['left'], revs['right'],
+               outputfile, mergetype, strategies, target, cmd, loc_in,
+               blobs=blobs, paths=paths)
+
+def prepare(commits, target, strategies, jdimeopts=None, noop=False,
+            state=None, workspace=None, select=None, meta=None, clean=None):
+    """Prepare the merge scenarios of a merge commit.
+
+    The merge commit is given either by its hash or by the hashes of its
+    left and right parent. Yields a Job for each merged and each skipped
+    file that has not been completed according to `state` and that is
+    selected by the Filter `select`. Raises FileExistsError if the output
+    directory already exists. With a `workspace` that is not full, the
+    scenarios are prepared there. `meta` holds the parents, merge base
+    and timestamp of a merge commit given by its full hash, as yielded
+    by MergeCommits, which are otherwise looked up with git. With `clean`,
+    the merged files are classified by git merge-tree, or by the
+    'conflicts' of `meta`: files with conflicts come first, and files
+    without conflicts are prepared only for the strategies in `clean`.
+    """
+    project = os.path.basename(os.getcwd())
+    revs = collections.OrderedDict()
+
+    if len(commits) == 1:
+        # Only mergecommit is specified. We need to compute left and right.
+        if meta:
+            mergecommit = commits[0]
+            parents = meta['parents']
+        else:
+            mergecommit = git('rev-parse', commits[0]).strip()
+            parents = git('log', '--pretty=%P', '-n1',
+                          mergecommit).strip().split(' ')
+        try:
+            left, right = parents
+        except ValueError:
+            # octopus are merges not supported by us
+            return
+        target = os.path.join(target, commits[0])
+    else:
+        # Left and right are provided. Need to find merge commit.
+        left = git('rev-parse', commits[0]).strip()
+        right = git('rev-parse', commits[1]).strip()
+        mergecommit = find_merge(left, right)
+        assert mergecommit is not None
+        target = os.path.join(target, commits[0] + '-' + commits[1])
+
+    if (os.path.exists(target) and not noop and
+            not (state and state.started(mergecommit))):
+        # only an interrupted merge commit may be resumed in place
+        raise FileExistsError('Directory exists: %s' % target)
+
+    if workspace and not noop and not workspace.full():
+        target = workspace.scenario(target)
+    else:
+        workspace = None
+
+    if state:
+        strategies = [strategy for strategy in strategies
+                      if not state.done(mergecommit, strategy)]
+
+    if len(strategies) == 0:
+        return
+
+    revs['merge'] = mergecommit
+    revs['left'] = left
+    if meta:
+        base = meta['base']
+    else:
+        try:
+            base = git('merge-base', left, right).strip()
+        except ProcessExecutionError:
+            base = None
+    if base:
+        revs['base'] = base
+        if revs['base'] == left or revs['base'] == right:
+            eprint("%s is a fast-forward merge" % mergecommit)
+            # return
+    else:
+        # two-way merge
+        eprint("%s is a two-way merge" % mergecommit)
+    revs['right'] = right
 
-    writer.writerow([project, timestamp, revs['merge'], revs['left'], revs['right'],
-                     outputfile, mergetype, strategies, target, cmd, loc_in])
+    if meta:
+        timestamp = meta['timestamp']
+    else:
+        timestamp = git('log', '--pretty=%ci', '-n1', mergecommit).strip()
+
+    with TRACE.span('classify', 'prepare', merge=mergecommit):
+        merged_files, skipped_files = get_merged_files(revs)
+    conflicts = None
+    if clean is not None:
+        if meta and 'conflicts' in meta:
+            conflicts = meta['conflicts']
+        else:
+            conflicts = get_git_conflicts([(left, right)])[0]
+        merged_files.sort(key=lambda lbr: lbr[0] not in conflicts)
+    for lbr in merged_files:
+        if select and not (select.file(lbr[0]) and select.ways(lbr, revs)):
+            continue
+        todo = strategies
+        if conflicts is not None and lbr[0] not in conflicts:
+            todo = [strategy for strategy in todo if strategy in clean]
+            if not todo:
+                continue
+        if state:
+            todo = [strategy for strategy in todo
+                    if not state.done(mergecommit, strategy, lbr[0])]
+            if not todo:
+                continue
+        with TRACE.span('prepare', 'prepare', merge=mergecommit, file=lbr[0]):
+            prepared = prepare_job(target, revs, lbr, todo, noop, workspace,
+                                   select)
+        if not prepared:
+            continue
+        inputfiles, outputfile, loc_in, blobs = prepared
+        job = make_job(target, project, timestamp, revs, todo, jdimeopts,
+                       inputfiles, outputfile, loc_in, blobs=blobs)
+        if conflicts is not None:
+            job.git_conflicts = conflicts.get(lbr[0], 0)
+        yield job
+    for f, reason in skipped_files.items():
+        if select and not select.skipped(f):
+            continue
+        if state and state.done(mergecommit, '', f):
+            continue
+        yield make_job(target, project, timestamp, revs, strategies,
+                       jdimeopts, [], f, 0, reason)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -166,102 +909,59 @@ def main():
     parser.add_argument('-j', '--jdimeopts',
                         help='Additional options to pass to jdime',
                         type=str)
+    parser.add_argument('-f', '--file',
+                        help='Prepare only files with this path or name, '
+                             'which may be a glob pattern (repeatable)',
+                        action='append')
+    parser.add_argument('--min-loc',
+                        help='Prepare only files with at least this many '
+                             'lines of input',
+                        type=int)
+    parser.add_argument('--max-loc',
+                        help='Prepare only files with at most this many '
+                             'lines of input',
+                        type=int)
+    parser.add_argument('--mergetype',
+                        help='Prepare only files with a base (3-way) or '
+                             'without (2-way)',
+                        choices=['2-way', '3-way'])
     parser.add_argument('-n', '--noop',
                         help='Do not actually run',
                         action="store_true")
     parser.add_argument('-s', '--statedir',
                         help='Use state files to skip completed tasks',
                         type=str)
+    parser.add_argument('-v', '--verbose',
+                        help='Report the number of spawned processes',
+                        action="store_true")
     parser.add_argument('commits', default=[], nargs='+')
     args = parser.parse_args()
 
-    global STRATEGIES
-
     if args.output:
         target = args.output
     else:
         target = tempfile.mkdtemp(prefix="jdime.")
 
-    project = os.path.basename(os.getcwd())
-    revs = collections.OrderedDict()
-    commits = args.commits
-
-    if args.modes:
-        STRATEGIES = args.modes.split(',')
-
-    state=None
+    state = None
     if args.statedir:
-        statedir = args.statedir
-        if not os.path.exists(statedir):
-            os.makedirs(statedir)
-        state = os.path.join(statedir, project)
+        state = State(args.statedir, os.path.basename(os.getcwd()))
 
-    if len(commits) is 1:
-        # Only mergecommit is specified. We need to compute left and right.
-        mergecommit = GIT['rev-parse', commits[0]]().strip()
-        try:
-            left, right = GIT['log', '--pretty=%P', '-n1',
-                              mergecommit]().strip().split(' ')
-        except ValueError:
-            # octopus are merges not supported by us
-            sys.exit(0)
-        target = os.path.join(target, commits[0])
-    else:
-        # Left and right are provided. Need to find merge commit.
-        # TODO: it would be really great if this was easier
-        left = GIT['rev-parse', commits[0]]().strip()
-        right = GIT['rev-parse', commits[1]]().strip()
-        mergecommit = None
-        for line in GIT['log', '--pretty=%H %P', '--all']().splitlines():
-            scenario = line.strip().split(' ')
-            if len(scenario) != 3:
-                continue
-            if scenario[1] == left and scenario[2] == right:
-                mergecommit = scenario[0]
-                break
-        assert mergecommit is not None
-        target = os.path.join(target, commits[0] + '-' + commits[1])
+    select = Filter(args.file, args.min_loc, args.max_loc, args.mergetype)
 
-    if os.path.exists(target):
-        eprint('Error! Directory exists: %s\nExiting.' % target)
-        sys.exit(1)
-
-    if state and os.path.isfile(state):
-        with open(state, 'r') as f:
-            for task in csv.DictReader(f, delimiter=';', fieldnames=['project',
-                                                                     'merge',
-                                                                     'strategy']):
-                if task['merge'] == mergecommit:
-                    if task['strategy'] in STRATEGIES:
-                        STRATEGIES.remove(task['strategy'])
-
-    if len(STRATEGIES) == 0:
-        return
-
-    revs['merge'] = mergecommit
-    revs['left'] = left
+    writer = csv.writer(sys.stdout, delimiter=';')
     try:
-        revs['base'] = GIT['merge-base', left, right]().strip()
-        if revs['base'] == left or revs['base'] == right:
-            eprint("%s is a fast-forward merge" % mergecommit)
-            # return
-    except ProcessExecutionError:
-        # two-way merge
-        eprint("%s is a two-way merge" % mergecommit)
-        pass
-    revs['right'] = right
-
-    timestamp = GIT['log', '--pretty=%ci', '-n1', mergecommit]().strip()
+        for job in prepare(args.commits, target, args.modes.split(','),
+                           args.jdimeopts, args.noop, state, select=select):
+            writer.writerow(job.row())
+    except FileExistsError as e:
+        eprint('Error! %s\nExiting.' % e)
+        sys.exit(1)
+    BLOBS.close()
+    if state:
+        state.close()
 
-    writer = csv.writer(sys.stdout, delimiter=';')
-    merged_files, skipped_files = get_merged_files(revs)
-    for lbr in merged_files:
-        inputfiles, outputfile, loc_in = prepare_job(target, revs, lbr, args.noop)
-        write_job(writer, target, project, timestamp, revs, args.jdimeopts,
-                  inputfiles, outputfile, loc_in)
-    for f, reason in skipped_files.items():
-        write_job(writer, target, project, timestamp, revs, args.jdimeopts,
-                  [], f, 0, reason)
+    if args.verbose:
+        print_forks()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#
+# Student's t-distribution for git jdime and the scripts, without scipy.
+# The array versions need numpy and use scipy if it is installed.
+
+import math
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from scipy import special
+except ImportError:
+    special = None
+
+def betainc(a, b, x):
+    """Return the regularized incomplete beta function I_x(a, b)."""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        # the continued fraction converges quickly only below the mean
+        return 1 - betainc(b, a, 1 - x)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) +
+                     a * math.log(x) + b * math.log1p(-x)) / a
+    # Lentz's algorithm for the continued fraction
+    tiny = 1e-300
+    f, c, d = 1.0, 1.0, 0.0
+    for i in range(1000):
+        m = i // 2
+        if i == 0:
+            numerator = 1.0
+        elif i % 2 == 0:
+            numerator = m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m))
+        else:
+            numerator = (-(a + m) * (a + b + m) * x /
+                         ((a + 2 * m) * (a + 2 * m + 1)))
+        d = 1 + numerator * d
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = 1 + numerator / c
+        c = c if abs(c) > tiny else tiny
+        f *= c * d
+        if abs(1 - c * d) < 1e-15:
+            break
+    return front * (f - 1)
+
+def t_sf(t, df):
+    """Return P(T > t) of Student's t-distribution."""
+    tail = betainc(df / 2, 0.5, df / (df + t * t)) / 2
+    return tail if t >= 0 else 1 - tail
+
+def t_quantile(p, df):
+    """Return the p-quantile of Student's t-distribution."""
+    if p < 0.5:
+        return -t_quantile(1 - p, df)
+    low, high = 0.0, 1.0
+    while t_sf(high, df) > 1 - p:
+        low, high = high, 2 * high
+    # bisection down to the precision of a double
+    for i in range(200):
+        middle = (low + high) / 2
+        if middle in (low, high):
+            break
+        if t_sf(middle, df) > 1 - p:
+            low = middle
+        else:
+            high = middle
+    return high
+
+def betainc_array(a, b, x):
+    """Return I_x(a, b) elementwise for numpy arrays, like betainc()."""
+    a, b, x = numpy.broadcast_arrays(*(numpy.asarray(v, dtype=float)
+                                       for v in (a, b, x)))
+    result = numpy.full(x.shape, numpy.nan)
+    result[x <= 0] = 0.0
+    result[x >= 1] = 1.0
+    inside = (x > 0) & (x < 1)
+    flip = inside & (x > (a + 1) / (a + b + 2))
+    a, b = numpy.where(flip, b, a)[inside], numpy.where(flip, a, b)[inside]
+    x = numpy.where(flip, 1 - x, x)[inside]
+
+    lgamma = numpy.frompyfunc(math.lgamma, 1, 1)
+    front = numpy.exp((lgamma(a + b) - lgamma(a) - lgamma(b)).astype(float) +
+                      a * numpy.log(x) + b * numpy.log1p(-x)) / a
+    # Lentz's algorithm on the elements that have not converged yet
+    tiny = 1e-300
+    f = numpy.ones(x.shape)
+    c = numpy.ones(x.shape)
+    d = numpy.zeros(x.shape)
+    active = numpy.arange(len(x))
+    for i in range(1000):
+        aa, bb, xx = a[active], b[active], x[active]
+        m = i // 2
+        if i == 0:
+            numerator = numpy.ones(len(active))
+        elif i % 2 == 0:
+            numerator = m * (bb - m) * xx / ((aa + 2 * m - 1) * (aa + 2 * m))
+        else:
+            numerator = (-(aa + m) * (aa + bb + m) * xx /
+                         ((aa + 2 * m) * (aa + 2 * m + 1)))
+        dd = 1 + numerator * d[active]
+        dd = 1 / numpy.where(numpy.abs(dd) > tiny, dd, tiny)
+        cc = 1 + numerator / c[active]
+        cc = numpy.where(numpy.abs(cc) > tiny, cc, tiny)
+        f[active] *= cc * dd
+        c[active], d[active] = cc, dd
+        active = active[numpy.abs(1 - cc * dd) >= 1e-15]
+        if not len(active):
+            break
+    value = front * (f - 1)
+    result[inside] = numpy.where(flip[inside], 1 - value, value)
+    return result
+
+def t_sf_array(t, df):
+    """Return P(T > t) elementwise for numpy arrays, like t_sf()."""
+    t = numpy.asarray(t, dtype=float)
+    df = numpy.asarray(df, dtype=float)
+    if special:
+        return special.stdtr(df, -t)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        tail = betainc_array(df / 2, 0.5, df / (df + t * t)) / 2
+    return numpy.where(t >= 0, tail, 1 - tail)
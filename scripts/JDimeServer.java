@@ -0,0 +1,137 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+
+/**
+ * Runs the merges of git jdime --server in a single long-lived JVM.
+ *
+ * A request on stdin is a line with the number of arguments of a jdime
+ * invocation, followed by the arguments, each terminated by NUL. The main class of JDime (JDIME_MAIN,
+ * de.fosd.jdime.Main by default) is run with them in this JVM, while
+ * System.out and System.err are captured. The answer on stdout is a line
+ * "returncode length-of-stdout length-of-stderr", followed by both. The
+ * server exits once stdin is closed.
+ */
+public class JDimeServer {
+
+    /** Thrown instead of exiting the JVM when JDime calls System.exit. */
+    static class Exit extends SecurityException {
+        final int status;
+
+        Exit(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    @SuppressWarnings("removal")
+    static void trapExit() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    throw new Exit(status);
+                }
+            });
+        } catch (UnsupportedOperationException e) {
+            // a merge that calls System.exit ends the server then
+            System.err.println("JDimeServer: cannot trap System.exit, "
+                    + "run with -Djava.security.manager=allow");
+        }
+    }
+
+    static int merge(Method jdime, String[] args) {
+        try {
+            jdime.invoke(null, (Object) args);
+            return 0;
+        } catch (InvocationTargetException e) {
+            if (e.getCause() instanceof Exit) {
+                return ((Exit) e.getCause()).status;
+            }
+            e.getCause().printStackTrace();
+            return 1;
+        } catch (IllegalAccessException e) {
+            e.printStackTrace();
+            return 1;
+        }
+    }
+
+    /** Returns the arguments of the next request, or null at the end. */
+    static String[] read(InputStream in) throws IOException {
+        ByteArrayOutputStream token = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != '\n') {
+            if (b == -1) {
+                return null;
+            }
+            token.write(b);
+        }
+        String[] args = new String[Integer.parseInt(token.toString("UTF-8"))];
+        for (int i = 0; i < args.length; i++) {
+            token.reset();
+            while ((b = in.read()) != 0) {
+                if (b == -1) {
+                    return null;
+                }
+                token.write(b);
+            }
+            args[i] = new String(token.toByteArray(), StandardCharsets.UTF_8);
+        }
+        return args;
+    }
+
+    public static void main(String[] args) throws Exception {
+        String name = System.getenv().getOrDefault("JDIME_MAIN",
+                "de.fosd.jdime.Main");
+        Method jdime = Class.forName(name).getMethod("main", String[].class);
+        trapExit();
+
+        InputStream in = new BufferedInputStream(
+                new FileInputStream(FileDescriptor.in));
+        OutputStream out = new BufferedOutputStream(
+                new FileOutputStream(FileDescriptor.out));
+        PrintStream stdout = System.out;
+        PrintStream stderr = System.err;
+        String[] argv;
+        while ((argv = read(in)) != null) {
+            ByteArrayOutputStream capturedOut = new ByteArrayOutputStream();
+            ByteArrayOutputStream capturedErr = new ByteArrayOutputStream();
+            int ret;
+            System.setOut(new PrintStream(capturedOut, true, "UTF-8"));
+            System.setErr(new PrintStream(capturedErr, true, "UTF-8"));
+            try {
+                ret = merge(jdime, argv);
+            } finally {
+                System.out.flush();
+                System.err.flush();
+                System.setOut(stdout);
+                System.setErr(stderr);
+            }
+
+            byte[] o = capturedOut.toByteArray();
+            byte[] e = capturedErr.toByteArray();
+            out.write((ret + " " + o.length + " " + e.length + "\n")
+                    .getBytes(StandardCharsets.UTF_8));
+            out.write(o);
+            out.write(e);
+            out.flush();
+        }
+        // threads JDime left behind must not keep the JVM alive
+        Runtime.getRuntime().halt(0);
+    }
+}
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+#
+# Summarizes conflicts and runtimes of git jdime results per project and
+# strategy.
+#
+# Reads the chunk files written by git jdime --columnar, or csv files of
+# git jdime -c, and prints one ';'-separated line per group:
+#   aggregate.py ~/columnar
+#   aggregate.py -g strategy ~/csv/*.csv
+
+import argparse
+import csv
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from git_jdime import OUTPUTCOLS, TEXTCOLS
+
+def get_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, f) for f in os.listdir(path)
+                            if f.endswith('.npz') or f.endswith('.csv'))
+        else:
+            files.append(path)
+    return files
+
+def read_csv(path):
+    """Return the columns of a csv file as arrays, like the chunk files.
+
+    Files without a header are expected to start with the default columns.
+    """
+    with open(path, newline='') as f:
+        rows = [row for row in csv.reader(f, delimiter=';') if row]
+    if not rows:
+        return {}
+    columns = OUTPUTCOLS
+    if rows[0][0] == 'project':
+        columns = rows[0]
+    rows = [row for row in rows if row != columns]
+    values = list(zip(*rows))
+    arrays = {}
+    for i, col in enumerate(columns[:len(values)]):
+        if col in TEXTCOLS:
+            arrays[col] = np.array(values[i], dtype=str)
+        else:
+            arrays[col] = np.array([float(v) if v else math.nan
+                                    for v in values[i]])
+    return arrays
+
+def load(files, columns):
+    """Concatenate the given columns of all files."""
+    parts = {col: [] for col in columns}
+    for path in files:
+        if path.endswith('.csv'):
+            arrays = read_csv(path)
+        else:
+            arrays = np.load(path)
+        if not arrays:
+            continue
+        n = len(arrays['project'])
+        for col in columns:
+            if col in arrays:
+                parts[col].append(arrays[col])
+            elif col in TEXTCOLS:
+                parts[col].append(np.full(n, '', dtype=str))
+            else:
+                parts[col].append(np.full(n, np.nan))
+    return {col: np.concatenate(parts[col]) if parts[col] else np.array([])
+            for col in columns}
+
+def summarize(data, groups):
+    """Return the group keys and a dict of summary columns per group."""
+    keys = np.stack([data[col] for col in groups], axis=1)
+    keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    n = len(keys)
+
+    def total(values):
+        return np.bincount(inverse, weights=np.nan_to_num(values), minlength=n)
+
+    def count(mask):
+        return np.bincount(inverse, weights=mask, minlength=n)
+
+    conflicts = data['conflicts']
+    runtime = data['runtime']
+    failed = np.char.startswith(data['mergetype'], 'FAILED')
+    merged = ~np.isnan(conflicts)
+    timed = ~np.isnan(runtime)
+
+    summary = {}
+    summary['files'] = count(np.ones(len(inverse)))
+    summary['merged'] = count(merged)
+    summary['failed'] = count(failed)
+    summary['conflicting'] = count(conflicts > 0)
+    summary['conflicts'] = total(conflicts)
+    summary['clines'] = total(data['clines'])
+    summary['ctokens'] = total(data['ctokens'])
+    summary['runtime'] = total(runtime)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        summary['runtime_mean'] = summary['runtime'] / count(timed)
+
+    # medians: sort the runtimes by group, then pick the middle of each group
+    order = np.lexsort((runtime, inverse))
+    order = order[timed[order]]
+    sorted_runtime = runtime[order]
+    bounds = np.searchsorted(inverse[order], np.arange(n + 1))
+    lengths = np.diff(bounds)
+    some = lengths > 0
+    lower = bounds[:-1][some] + (lengths[some] - 1) // 2
+    upper = bounds[:-1][some] + lengths[some] // 2
+    summary['runtime_median'] = np.full(n, np.nan)
+    summary['runtime_median'][some] = (sorted_runtime[lower] +
+                                       sorted_runtime[upper]) / 2
+    return keys, summary
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--group',
+                        help='Summarize per these columns, separated by comma',
+                        type=str,
+                        default='project,strategy')
+    parser.add_argument('paths',
+                        help='Chunk files, csv files or directories of them',
+                        nargs='+')
+    args = parser.parse_args()
+
+    groups = args.group.split(',')
+    columns = set(groups) | {'project', 'mergetype', 'conflicts', 'clines',
+                             'ctokens', 'runtime'}
+    data = load(get_files(args.paths), columns)
+    # skipped files are neither merged nor failed
+    rows = data['mergetype'] != 'skipped'
+    data = {col: values[rows] for col, values in data.items()}
+    if not len(data['project']):
+        print('No results found.', file=sys.stderr)
+        sys.exit(1)
+
+    keys, summary = summarize(data, groups)
+    writer = csv.writer(sys.stdout, delimiter=';', lineterminator='\n')
+    writer.writerow(groups + list(summary))
+    for i, key in enumerate(keys):
+        writer.writerow(list(key) +
+                        ['%d' % values[i] if name not in
+                         ('runtime', 'runtime_mean', 'runtime_median')
+                         else '%.3f' % values[i]
+                         for name, values in summary.items()])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+#
+# Runs git jdime on the merge commits of several repositories.
+#
+# The merge commits of each repository that are not complete in the
+# state dir yet are split into chunks. Each chunk is a unit of work, run
+# by one git jdime process. All units go into one queue, interleaved
+# across the projects, and a pool of workers takes the next unit as soon
+# as it is done with the previous one. So a single huge project does not
+# leave the other workers idle.
+#
+# Rows are appended to <csvdir>/<project>.csv and printed to stdout:
+#   batch.py -J 8 -c ~/csv -s ~/state -o /tmp/jdime -d ~/mirrors \
+#       -a '-m linebased,structured -p' | colorize.py
+
+import argparse
+import itertools
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+from plumbum import local
+from plumbum.commands import ProcessExecutionError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from git_jdime import MODES
+from git_preparemerge import MergeCommits, State, format_merge
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+def get_repos(repos, mirrors):
+    """Return the repositories given directly or as subdirectories."""
+    repos = [os.path.abspath(repo) for repo in repos]
+    if mirrors:
+        for entry in sorted(os.scandir(mirrors), key=lambda e: e.name):
+            if entry.is_dir():
+                repos.append(os.path.abspath(entry.path))
+    return repos
+
+def get_project(repo):
+    # the same name git jdime uses for the project column and state
+    return os.path.basename(repo.rstrip(os.sep))
+
+def get_merge_commits(repo, before, after, statedir, strategies):
+    """Return the merge commits of a repository that are not complete in
+    `statedir`, as lines for git jdime --merges.
+
+    The lines carry the parents, timestamp and merge base of each merge
+    commit, so the history is read once here, not once per chunk.
+    """
+    with local.cwd(repo):
+        merges = MergeCommits(before, after)
+        if statedir:
+            state = State(statedir, get_project(repo))
+            merges.merges = [merge for merge in merges.merges
+                             if not all(state.done(merge[0], strategy)
+                                        for strategy in strategies)]
+            state.close()
+        return [format_merge(merge, info) for merge, info in merges]
+
+def get_strategies(args):
+    """Return the strategies that the git jdime arguments ask for."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('-m', '--modes', default=MODES)
+    return parser.parse_known_args(args)[0].modes.split(',')
+
+def get_units(repos, before, after, statedir, strategies, size):
+    """Return (repo, chunk, merge commits) units, taking turns between
+    projects. Merge commits that are complete in `statedir` are left out."""
+    chunks = []
+    for repo in repos:
+        try:
+            commits = get_merge_commits(repo, before, after, statedir,
+                                        strategies)
+        except ProcessExecutionError:
+            eprint('%s: not a git repository, skipped' % repo)
+            continue
+        chunks.append([(repo, i // size, commits[i:i + size])
+                       for i in range(0, len(commits), size)])
+    return [unit for units in itertools.zip_longest(*chunks)
+            for unit in units if unit]
+
+class Sinks:
+    """Appends the rows of each project to a csv file of its own."""
+
+    def __init__(self, csvdir):
+        self.csvdir = csvdir
+        self.lock = threading.Lock()
+        if csvdir:
+            os.makedirs(csvdir, exist_ok=True)
+
+    def write(self, project, rows):
+        with self.lock:
+            if self.csvdir:
+                path = os.path.join(self.csvdir, project + '.csv')
+                with open(path, 'a') as csv:
+                    csv.write(rows)
+            sys.stdout.write(rows)
+            sys.stdout.flush()
+
+def work(units, sinks, cmd, core, failed):
+    def pin():
+        if core is not None:
+            os.sched_setaffinity(0, {core})
+
+    while True:
+        try:
+            repo, chunk, commits = units.get_nowait()
+        except queue.Empty:
+            return
+        project = get_project(repo)
+        proc = subprocess.run(cmd(project, chunk), cwd=repo,
+                              input='\n'.join(commits) + '\n',
+                              preexec_fn=pin, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, universal_newlines=True)
+        sinks.write(project, proc.stdout)
+        for line in proc.stderr.splitlines():
+            eprint('%s %d: %s' % (project, chunk, line))
+        if proc.returncode != 0:
+            failed.append((project, commits))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--mirrors',
+                        help='Use all repositories in this directory',
+                        type=str)
+    parser.add_argument('-J', '--jobs',
+                        help='Run this many git jdime processes in parallel, '
+                             'each pinned to a core of its own',
+                        type=int,
+                        default=1)
+    parser.add_argument('-o', '--output',
+                        help='Store merge scenarios in '
+                             '<output>/<project>/<chunk>',
+                        type=str,
+                        default='/tmp/jdime')
+    parser.add_argument('-n', '--chunk',
+                        help='Run this many merge commits per git jdime '
+                             'process',
+                        type=int,
+                        default=50)
+    parser.add_argument('-c', '--csv',
+                        help='Append csv lines to <csv>/<project>.csv',
+                        type=str)
+    parser.add_argument('-s', '--statedir',
+                        help='Use state files to skip completed tasks',
+                        type=str)
+    parser.add_argument('-t', '--tag',
+                        help='Append this tag to each line '
+                             '(default: output of jdime -v)',
+                        type=str)
+    parser.add_argument('-b', '--before',
+                        help='Use only commits before <date>',
+                        type=str)
+    parser.add_argument('--after',
+                        help='Use only commits after <date>',
+                        type=str)
+    parser.add_argument('-a', '--args',
+                        help='Additional arguments to pass to git jdime',
+                        type=str,
+                        default='')
+    parser.add_argument('repos', default=[], nargs='*')
+    args = parser.parse_args()
+
+    tag = args.tag
+    if not tag:
+        # ask the JVM once instead of once per merge commit
+        tag = subprocess.run(['jdime', '-v'], check=True,
+                             stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout.strip()
+
+    extra = shlex.split(args.args)
+
+    def cmd(project, chunk):
+        # a directory per process, which removes it once it is empty
+        cmd = ['git', 'jdime', '-c', '-t', tag,
+               '-o', os.path.join(args.output, project, str(chunk)),
+               '--merges', '-']
+        if args.statedir:
+            cmd += ['-s', args.statedir]
+        return cmd + extra + ['all']
+
+    start = time.time()
+    units = queue.Queue()
+    total = 0
+    for unit in get_units(get_repos(args.repos, args.mirrors), args.before,
+                          args.after, args.statedir, get_strategies(extra),
+                          args.chunk):
+        units.put(unit)
+        total += len(unit[2])
+
+    cores = [None] * args.jobs
+    available = sorted(os.sched_getaffinity(0))
+    if len(available) >= args.jobs:
+        cores = available[:args.jobs]
+
+    sinks = Sinks(args.csv)
+    failed = []
+    workers = [threading.Thread(target=work,
+                                args=(units, sinks, cmd, core, failed))
+               for core in cores]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    eprint('%d merge commits in %.0f seconds' % (total, time.time() - start))
+    if failed:
+        eprint('git jdime failed on %d chunks of merge commits:' %
+               len(failed))
+        for project, commits in failed:
+            eprint('  %s %s' % (project, ' '.join(line.split('\t')[0]
+                                                  for line in commits)))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
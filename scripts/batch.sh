@@ -5,6 +5,7 @@ CSV="$HOME/csv"
 TMPDIR="/tmp/jdime"
 STATEDIR="$HOME/state"
 JDIMESRC="$HOME/src/jdime"
+JOBS="$(nproc)"
 
 SCRIPTS="$(dirname $(readlink -f $0))"
 
@@ -24,6 +25,7 @@ else
 	urls="$(cat $PROJECTS)"
 fi
 
+repos=""
 for url in $urls; do
 	url=$(echo "$url" | sed -e 's/http:/https:/')
 	cd $REPOS
@@ -42,7 +44,9 @@ for url in $urls; do
 		fi
 	fi
 	if [ -d "${repo}" ]; then
-		cd ${repo}
-		git jdime -o $TMPDIR -s $STATEDIR -t $JDIMEVERSION -m linebased,structured,linebased+structured,linebased+semistructured+structured,semistructured -p $OPTIONS all -c -r 10 | tee -a ${CSV}/${repo}.csv | ${SCRIPTS}/colorize.py
+		repos="$repos $REPOS/$repo"
 	fi
 done
+
+# merge commits of all projects share one pool of workers
+${SCRIPTS}/batch.py -J $JOBS -o $TMPDIR -s $STATEDIR -c $CSV -t $JDIMEVERSION $OPTIONS -a "-m linebased,structured,linebased+structured,linebased+semistructured+structured,semistructured -p -r 10" $repos | ${SCRIPTS}/colorize.py
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+#
+# Compares the time git spends to classify the files of merge commits
+# with a single '-z --name-status -M' diff per direction against the
+# four diffs (AM and R filters, both directions) used before.
+#
+# Run it from the workdir of a repository with many merges:
+#   benchmark-merged-files.py -n 500
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+import git_preparemerge
+from git_preparemerge import FORKS, git, get_changes, get_merged_files
+
+def get_changes_legacy(a, b):
+    files = set()
+    new = set()
+    renamed = {}
+    for line in git('diff', '--name-status', '--diff-filter=AM',
+                    a + '...' + b).splitlines():
+        t, f = line.split('\t')[0:2]
+        files.add(f)
+        if t == 'A':
+            new.add(f)
+    for line in git('diff', '--name-status', '--diff-filter=R',
+                    a + '...' + b).splitlines():
+        old, f = line.split('\t')[1:3]
+        renamed[f] = old
+    return (files, new, renamed)
+
+def classify(revs, changes):
+    git_preparemerge.get_changes = changes
+    FORKS.clear()
+    t0 = time.time()
+    merged_files, skipped_files = get_merged_files(revs)
+    t1 = time.time()
+    return (t1 - t0, sum(FORKS.values()), sorted(merged_files), skipped_files)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number',
+                        help='Use only the last n merge commits',
+                        type=int)
+    args = parser.parse_args()
+
+    merges = git('log', '--all', '--merges', '--pretty=%H %P').splitlines()
+    if args.number:
+        merges = merges[:args.number]
+
+    times = {'legacy': [], 'consolidated': []}
+    forks = {'legacy': 0, 'consolidated': 0}
+    mismatches = 0
+    for line in merges:
+        scenario = line.split(' ')
+        if len(scenario) != 3:
+            # octopus merge
+            continue
+        revs = {'merge': scenario[0], 'left': scenario[1], 'right': scenario[2]}
+        results = {}
+        for name, changes in (('legacy', get_changes_legacy),
+                              ('consolidated', get_changes)):
+            t, n, merged_files, skipped_files = classify(revs, changes)
+            times[name].append(t)
+            forks[name] += n
+            results[name] = (merged_files, skipped_files)
+        if results['legacy'] != results['consolidated']:
+            mismatches += 1
+            print('%s: classification differs' % revs['merge'], file=sys.stderr)
+
+    scenarios = len(times['legacy'])
+    if scenarios == 0:
+        print('No merge commits found.')
+        return
+
+    print('%d merge commits' % scenarios)
+    for name in times:
+        print('%-12s %8.2f ms/merge (median %.2f ms), %d git processes' %
+              (name,
+               1000 * statistics.mean(times[name]),
+               1000 * statistics.median(times[name]),
+               forks[name]))
+    print('speedup: %.2fx' % (sum(times['legacy']) / sum(times['consolidated'])))
+    if mismatches:
+        print('%d merge commits were classified differently' % mismatches)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
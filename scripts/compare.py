@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+#
+# Compares the runtimes of two sets of git jdime results, e.g., of two
+# JDime versions, per merge scenario and strategy.
+#
+# Each result set is given as chunk files of git jdime --columnar, csv
+# files of git jdime -c, or directories of them:
+#   compare.py ~/csv/v1 ~/csv/v2
+#
+# Exits with 1 if the second set is significantly slower, so it can be
+# used to check a new JDime version before a release. Per scenario, the
+# runtimes of repeated runs (-r with --stats or --ci) are compared with
+# Welch's t-test. Per strategy, the log runtime ratios of all scenarios
+# are tested against 0. Runs taken under interference (--isolate) are
+# left out.
+
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+from aggregate import get_files, load
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from jdime_stats import t_sf_array
+
+KEYS = ['project', 'mergecommit', 'file', 'strategy']
+PHASES = ['t_parse', 't_merge', 't_semistructure', 't_LinebasedStrategy',
+          't_SemiStructuredStrategy', 't_StructuredStrategy']
+COLUMNS = KEYS + PHASES + ['mergetype', 'runtime', 'runtime_mean',
+                           'runtime_stdev', 'runs', 'env', 'disturbed']
+
+def get_results(paths):
+    """Return the results of a set, one per scenario and strategy."""
+    data = load(get_files(paths), COLUMNS)
+    rows = ~np.isnan(data['runtime'])
+    data = {col: values[rows] for col, values in data.items()}
+    keys = data[KEYS[0]]
+    for col in KEYS[1:]:
+        keys = np.char.add(np.char.add(keys, '\x1f'), data[col])
+    # results of repeated campaigns: the first one counts
+    keys, first = np.unique(keys, return_index=True)
+    return keys, {col: values[first] for col, values in data.items()}
+
+def welch(old, new):
+    """Return the t statistics and degrees of freedom of Welch's t-test.
+
+    Scenarios without repetitions get NaN.
+    """
+    m1, m2 = old['runtime_mean'], new['runtime_mean']
+    # results without --stats are single runs
+    m1 = np.where(np.isnan(m1), old['runtime'], m1)
+    m2 = np.where(np.isnan(m2), new['runtime'], m2)
+    n1, n2 = old['runs'], new['runs']
+    v1 = old['runtime_stdev'] ** 2 / n1
+    v2 = new['runtime_stdev'] ** 2 / n2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = (m2 - m1) / np.sqrt(v1 + v2)
+        df = (v1 + v2) ** 2 / (v1 ** 2 / (n1 - 1) + v2 ** 2 / (n2 - 1))
+    repeated = (n1 > 1) & (n2 > 1)
+    return np.where(repeated, t, np.nan), np.where(repeated, df, np.nan)
+
+def significant(t, df, alpha):
+    """Return which t statistics are significant in a two-sided test."""
+    with np.errstate(invalid='ignore'):
+        p = 2 * t_sf_array(np.abs(t), df)
+        return (df > 0) & (p < alpha)
+
+def print_scenarios(title, rows, keys, old, new, ratio, t, marked):
+    print(title)
+    print('%-9s %8s %8s %7s %7s  %s' % ('strategy', 'old[s]', 'new[s]',
+                                       'ratio', 't', 'scenario'))
+    for i in rows:
+        project, mergecommit, file, strategy = keys[i].split('\x1f')
+        print('%-9s %8.3f %8.3f %7.2f %7.1f%s %s %s %s' %
+              (strategy, old['runtime'][i], new['runtime'][i], ratio[i], t[i],
+               '*' if marked[i] else ' ', project, mergecommit, file))
+    print()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--alpha',
+                        help='Significance level of the tests',
+                        type=float,
+                        default=0.05)
+    parser.add_argument('-m', '--min-ratio',
+                        help='Report slowdowns only if the new runtime is at '
+                             'least this many times the old one',
+                        type=float,
+                        default=1.05)
+    parser.add_argument('-n', '--top',
+                        help='List this many regressions and improvements',
+                        type=int,
+                        default=10)
+    parser.add_argument('old', help='Result set of the baseline')
+    parser.add_argument('new', help='Result set to compare with the baseline')
+    args = parser.parse_args()
+
+    old_keys, old = get_results([args.old])
+    new_keys, new = get_results([args.new])
+    keys, i, j = np.intersect1d(old_keys, new_keys, assume_unique=True,
+                                return_indices=True)
+    old = {col: values[i] for col, values in old.items()}
+    new = {col: values[j] for col, values in new.items()}
+    print('%d scenarios in both sets, %d only in the old one, %d only in '
+          'the new one' % (len(keys), len(old_keys) - len(keys),
+                           len(new_keys) - len(keys)))
+    if not len(keys):
+        sys.exit(1)
+
+    old_failed = np.char.startswith(old['mergetype'], 'FAILED')
+    new_failed = np.char.startswith(new['mergetype'], 'FAILED')
+    print('%d scenarios fail only in the old set, %d only in the new one' %
+          ((old_failed & ~new_failed).sum(), (new_failed & ~old_failed).sum()))
+    disturbed = (old['disturbed'] > 0) | (new['disturbed'] > 0)
+    print('%d scenarios were run under interference' % disturbed.sum())
+    for name, envs in (('old', old['env']), ('new', new['env'])):
+        for env in np.unique(envs[envs != '']):
+            print('Environment of the %s set: %s' % (name, env))
+    ok = (~old_failed & ~new_failed & ~disturbed & (old['runtime'] > 0))
+    keys = keys[ok]
+    old = {col: values[ok] for col, values in old.items()}
+    new = {col: values[ok] for col, values in new.items()}
+    print()
+
+    ratio = new['runtime'] / old['runtime']
+    t, df = welch(old, new)
+    # one test per scenario: keep the chance of any false alarm at alpha
+    slower = ((ratio >= args.min_ratio) &
+              significant(t, df, args.alpha / max(len(keys), 1)) & (t > 0))
+    faster = ((ratio <= 1 / args.min_ratio) &
+              significant(t, df, args.alpha / max(len(keys), 1)) & (t < 0))
+    repeated = ~np.isnan(t)
+
+    print('%-9s %9s %9s %9s %9s %9s %9s' % ('strategy', 'scenarios', 'repeated',
+                                             'slower', 'faster', 'geomean',
+                                             't'))
+    strategies, strategy = np.unique(new['strategy'], return_inverse=True)
+    strategy = strategy.reshape(-1)
+    logs = np.log(ratio)
+    n = np.bincount(strategy, minlength=len(strategies))
+    mean = np.bincount(strategy, weights=logs,
+                       minlength=len(strategies)) / n
+    var = np.bincount(strategy, weights=(logs - mean[strategy]) ** 2,
+                      minlength=len(strategies)) / np.maximum(n - 1, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        overall = mean / np.sqrt(var / n)
+    overall_slower = ((np.exp(mean) >= args.min_ratio) & (overall > 0) &
+                      significant(overall, n - 1.0, args.alpha) & (n > 1))
+    for k, name in enumerate(strategies):
+        rows = strategy == k
+        print('%-9s %9d %9d %9d %9d %9.3f %8.1f%s' %
+              (name, n[k], repeated[rows].sum(), slower[rows].sum(),
+               faster[rows].sum(), math.exp(mean[k]), overall[k],
+               '*' if overall_slower[k] else ' '))
+    print()
+
+    print('%-24s %12s %12s %12s' % ('phase', 'old[ms]', 'new[ms]',
+                                    'delta[ms]'))
+    for phase in PHASES:
+        both = ~np.isnan(old[phase]) & ~np.isnan(new[phase])
+        if not both.any():
+            continue
+        delta = new[phase][both] - old[phase][both]
+        print('%-24s %12.1f %12.1f %+12.1f' % (phase, old[phase][both].mean(),
+                                              new[phase][both].mean(),
+                                              delta.mean()))
+    print()
+
+    order = np.argsort(ratio)
+    top = order[::-1][:args.top]
+    print_scenarios('Top regressions (* significant):', top[ratio[top] > 1],
+                    keys, old, new, ratio, t, slower)
+    top = order[:args.top]
+    print_scenarios('Top improvements (* significant):', top[ratio[top] < 1],
+                    keys, old, new, ratio, t, faster)
+
+    if slower.any() or overall_slower.any():
+        print('The new set is significantly slower.', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
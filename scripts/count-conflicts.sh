@@ -4,5 +4,7 @@ CSV="$HOME/csv"
 cd $CSV
 echo "Project;Files;Conflicting Files;Conflicts"
 for csv in *.csv; do
-	awk -F';' 'BEGIN { rows=0; crows=0; conflicts=0 } { repo=$1; rows++; if($6!=0) { crows++; conflicts+=$6 } } END { print repo";"rows";"crows";"conflicts }' $csv
+	# column 9 holds the conflicts, column 7 the merge type; skipped and
+	# failed merges have no conflicts to count
+	awk -F';' 'BEGIN { rows=0; crows=0; conflicts=0 } $1 != "project" && $7 != "skipped" && $7 !~ /^FAILED/ { repo=$1; rows++; if($9+0 > 0) { crows++; conflicts+=$9 } } END { print repo";"rows";"crows";"conflicts }' $csv
 done
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+# Estimates conflict rates and runtimes of all merge scenarios from a
+# stratified sample of git jdime --sample, with confidence intervals.
+#
+# Reads the chunk files written by git jdime --columnar, or csv files of
+# git jdime -c, and prints one ';'-separated line per project and
+# strategy:
+#   estimate.py ~/csv/*.csv
+#
+# Each estimate is followed by the half width of its confidence interval.
+# Rows without a stratum, e.g., of runs without --sample, form a stratum
+# of their own with a weight of 1, so complete runs have no error.
+
+import argparse
+import csv
+import statistics
+import sys
+
+import numpy as np
+
+from aggregate import get_files, load
+
+def stratify(data, groups):
+    """Return the strata of all rows and the group of each stratum."""
+    keys = data[groups[0]]
+    for col in groups[1:]:
+        keys = np.char.add(np.char.add(keys, '\x1f'), data[col])
+    strata = np.char.add(np.char.add(keys, '\x1f'), data['stratum'])
+    strata, first, stratum = np.unique(strata, return_index=True,
+                                       return_inverse=True)
+    keys, group = np.unique(keys, return_inverse=True)
+    return stratum.reshape(-1), group.reshape(-1)[first], keys
+
+def estimate(values, stratum, group, population, groups):
+    """Return the estimated means of `values` per group and the variances.
+
+    Missing values, e.g., of failed merges, are left out of the sample of
+    their stratum.
+    """
+    valid = ~np.isnan(values)
+    values = np.nan_to_num(values)
+    n = np.bincount(stratum, weights=valid, minlength=len(population))
+    total = np.bincount(stratum, weights=values, minlength=len(population))
+    squares = np.bincount(stratum, weights=values ** 2,
+                          minlength=len(population))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / n
+        var = np.where(n > 1, (squares - n * mean ** 2) / (n - 1), 0)
+        # strata without any value do not count
+        size = np.where(n > 0, population, 0)
+        sizes = np.bincount(group, weights=size, minlength=groups)
+        share = size / sizes[group]
+        fpc = np.clip(1 - n / population, 0, 1)
+        estimates = np.bincount(group, weights=np.nan_to_num(share * mean),
+                                minlength=groups)
+        variances = np.bincount(group,
+                                weights=np.nan_to_num(share ** 2 * fpc *
+                                                      var / n),
+                                minlength=groups)
+    return np.where(sizes > 0, estimates, np.nan), variances
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-g', '--group',
+                        help='Estimate per these columns, separated by comma',
+                        type=str,
+                        default='project,strategy')
+    parser.add_argument('-c', '--confidence',
+                        help='Confidence level of the intervals',
+                        type=float,
+                        default=0.95)
+    parser.add_argument('paths',
+                        help='Chunk files, csv files or directories of them',
+                        nargs='+')
+    args = parser.parse_args()
+
+    groups = args.group.split(',')
+    columns = set(groups) | {'project', 'mergetype', 'conflicts', 'runtime',
+                             'stratum', 'weight'}
+    data = load(get_files(args.paths), columns)
+    rows = data['mergetype'] != 'skipped'
+    data = {col: values[rows] for col, values in data.items()}
+    if not len(data['project']):
+        print('No results found.', file=sys.stderr)
+        sys.exit(1)
+
+    stratum, group, keys = stratify(data, groups)
+    weight = np.where(np.isnan(data['weight']), 1, data['weight'])
+    # every row of a stratum stands for the same number of scenarios
+    population = np.bincount(stratum, weights=weight)
+    sampled = np.bincount(group[stratum], minlength=len(keys))
+    scenarios = np.bincount(group, weights=population, minlength=len(keys))
+
+    conflicts = data['conflicts']
+    conflicting = np.where(np.isnan(conflicts), np.nan, conflicts > 0)
+    z = statistics.NormalDist().inv_cdf((1 + args.confidence) / 2)
+    results = []
+    for name, values in (('conflicting', conflicting),
+                         ('conflicts', conflicts),
+                         ('runtime', data['runtime'])):
+        mean, var = estimate(values, stratum, group, population, len(keys))
+        results.append((name, mean, z * np.sqrt(var)))
+
+    writer = csv.writer(sys.stdout, delimiter=';', lineterminator='\n')
+    writer.writerow(groups + ['scenarios', 'sampled'] +
+                    [col for name, mean, ci in results
+                     for col in (name, name + '_ci')])
+    for i, key in enumerate(keys):
+        writer.writerow(key.split('\x1f') +
+                        ['%d' % round(scenarios[i]), '%d' % sampled[i]] +
+                        [value for name, mean, ci in results
+                         for value in ('%.4f' % mean[i], '%.4f' % ci[i])])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# merges with git merge-file and reports the conflicts like jdime does;
+# structured merges take FAKE_SLOW seconds, and merges whose output ends
+# in FAKE_FAIL (e.g., structured/A.java) fail
+FAKE_JDIME = '''#!%s
+import os
+import subprocess
+import sys
+import time
+
+args = sys.argv[1:]
+if args == ['-v']:
+    print('fakejdime 0.1')
+    sys.exit(0)
+out = args[args.index('-o') + 1]
+strategy = args[args.index('-m') + 1]
+files = [f for f in args[args.index('-o') + 2:] if f and not f.startswith('-')]
+if strategy == 'structured':
+    time.sleep(float(os.environ.get('FAKE_SLOW', 0)))
+if os.environ.get('FAKE_FAIL') and out.endswith('/' + os.environ['FAKE_FAIL']):
+    print('failed', file=sys.stderr)
+    sys.exit(200)
+if len(files) == 3:
+    data = subprocess.run(['git', 'merge-file', '-p'] + files,
+                          capture_output=True).stdout
+else:
+    data = open(files[0], 'rb').read()
+os.makedirs(os.path.dirname(out), exist_ok=True)
+with open(out, 'wb') as f:
+    f.write(data)
+conflicts = data.count(b'<<<<<<<')
+print('<statistics><mergescenariostatistics>'
+      '<conflicts>%%d</conflicts>'
+      '<lineStatistics numOccurInConflict="%%d"/>'
+      '<tokenStatistics numOccurInConflict="0"/>'
+      '<runtime label="merge" timeMS="1"/>'
+      '</mergescenariostatistics></statistics>' %% (conflicts, 2 * conflicts))
+''' % sys.executable
+
+# serves the requests of git jdime --server by running the fake jdime
+FAKE_SERVER = '''#!%s
+import subprocess
+import sys
+
+while True:
+    line = sys.stdin.buffer.readline()
+    if not line:
+        break
+    args = []
+    for i in range(int(line)):
+        arg = b''
+        while True:
+            c = sys.stdin.buffer.read(1)
+            if c in (b'\\0', b''):
+                break
+            arg += c
+        args.append(arg.decode('utf-8'))
+    proc = subprocess.run(['jdime'] + args, capture_output=True)
+    sys.stdout.buffer.write(b'%%d %%d %%d\\n' %% (proc.returncode,
+                                               len(proc.stdout),
+                                               len(proc.stderr)))
+    sys.stdout.buffer.write(proc.stdout + proc.stderr)
+    sys.stdout.buffer.flush()
+''' % sys.executable
+
+
+def git(cwd, *args):
+    return subprocess.run(['git'] + list(args), cwd=cwd, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def commit(cwd, message, files):
+    for name, content in files.items():
+        path = os.path.join(cwd, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+    git(cwd, 'add', '-A')
+    git(cwd, 'commit', '-q', '-m', message)
+    return git(cwd, 'rev-parse', 'HEAD').strip()
+
+
+def java(name, *fields):
+    return 'class %s {\n%s}\n' % (name, ''.join('  int %s;\n' % field
+                                               for field in fields))
+
+
+@pytest.fixture
+def fakebin(tmp_path, monkeypatch):
+    bindir = tmp_path / 'bin'
+    bindir.mkdir()
+    jdime = bindir / 'jdime'
+    jdime.write_text(FAKE_JDIME)
+    jdime.chmod(0o755)
+    server = bindir / 'jdime-server'
+    server.write_text(FAKE_SERVER)
+    server.chmod(0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bindir, os.environ['PATH']))
+    return bindir
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A repository with a merge commit that conflicts in A.java only."""
+    path = tmp_path / 'repo'
+    path.mkdir()
+    git(path, 'init', '-q', '-b', 'main')
+    git(path, 'config', 'user.name', 'test')
+    git(path, 'config', 'user.email', 'test@example.com')
+    commit(path, 'base', {'A.java': java('A', 'a', 'b', 'c', 'd'),
+                          'B.java': java('B', 'a', 'b', 'c', 'd')})
+    git(path, 'checkout', '-q', '-b', 'side')
+    commit(path, 'side', {'A.java': java('A', 'a1', 'b', 'c', 'd'),
+                          'B.java': java('B', 'a1', 'b', 'c', 'd')})
+    git(path, 'checkout', '-q', 'main')
+    commit(path, 'main', {'A.java': java('A', 'a2', 'b', 'c', 'd'),
+                          'B.java': java('B', 'a', 'b', 'c', 'd2')})
+    subprocess.run(['git', 'merge', '-q', 'side'], cwd=path,
+                   capture_output=True)
+    commit(path, 'merge', {'A.java': java('A', 'a1', 'b', 'c', 'd')})
+    return path
+
+
+def git_jdime(cwd, *args, env=None):
+    """Run git jdime in `cwd`, return the csv rows as dicts."""
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, 'git_jdime.py'),
+                           '-c', '-H'] + list(args), cwd=cwd,
+                          capture_output=True, text=True,
+                          env=dict(os.environ, **(env or {})))
+    assert proc.returncode == 0, proc.stderr
+    lines = [line for line in proc.stdout.splitlines() if line]
+    if not lines:
+        return []
+    header = lines[0].split(';')
+    return [dict(zip(header, line.split(';'))) for line in lines[1:]]
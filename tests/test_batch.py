@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from conftest import ROOT, commit, git, git_jdime, java
+
+from git_preparemerge import FORKS, MergeCommits, format_merge
+
+
+def add_merge(repo):
+    git(repo, 'checkout', '-q', '-b', 'side2', 'main')
+    commit(repo, 'side2', {'A.java': java('A', 'a3', 'b', 'c', 'd')})
+    git(repo, 'checkout', '-q', 'main')
+    commit(repo, 'main2', {'B.java': java('B', 'a', 'b', 'c', 'd3')})
+    git(repo, 'merge', '-q', '--no-ff', '-m', 'merge side2', 'side2')
+
+
+def test_merge_commits_from_lines(repo, monkeypatch):
+    add_merge(repo)
+    monkeypatch.chdir(repo)
+    merges = list(MergeCommits())
+    assert len(merges) == 2
+
+    FORKS.clear()
+    lines = [format_merge(merge, info) for merge, info in merges]
+    assert list(MergeCommits(only=lines)) == merges
+    assert not FORKS
+    # plain hashes still read the history
+    assert list(MergeCommits(only=[merges[1][0]])) == merges[1:]
+
+
+def test_batch_reads_history_once(repo, fakebin, tmp_path):
+    add_merge(repo)
+    log = tmp_path / 'git.log'
+    wrapper = fakebin / 'git'
+    wrapper.write_text('#!/bin/sh\necho "$*" >> %s\nexec %s "$@"\n' %
+                       (log, shutil.which('git')))
+    wrapper.chmod(0o755)
+    jdime = fakebin / 'git-jdime'
+    # git puts its exec path first, which would bypass the wrapper
+    jdime.write_text('#!/bin/sh\nPATH=%s:$PATH exec %s %s "$@"\n' %
+                     (fakebin, sys.executable,
+                      os.path.join(ROOT, 'git_jdime.py')))
+    jdime.chmod(0o755)
+
+    csvdir = tmp_path / 'csv'
+    proc = subprocess.run([sys.executable,
+                           os.path.join(ROOT, 'scripts', 'batch.py'),
+                           '-t', 'test', '-n', '1', '-c', str(csvdir),
+                           '-o', str(tmp_path / 'out'), '-a', '-m linebased',
+                           str(repo)],
+                          capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    calls = log.read_text().splitlines()
+    # two chunks of one merge commit each
+    assert len([call for call in calls if call.startswith('jdime')]) == 2
+    assert len([call for call in calls if '--all' in call.split()]) == 2
+
+    def scenarios(rows):
+        return sorted((row[2], row[5], row[8]) for row in rows)
+
+    rows = [line.split(';') for line in
+            (csvdir / 'repo.csv').read_text().splitlines()]
+    expected = git_jdime(repo, '-m', 'linebased', 'all')
+    assert scenarios(rows) == scenarios([list(row.values())
+                                         for row in expected])
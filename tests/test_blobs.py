@@ -0,0 +1,25 @@
+from conftest import commit, git, java
+
+from git_preparemerge import BlobReader
+
+
+def test_read(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    head = commit(repo, 'odd paths', {'new\nline.java': java('N'),
+                                      'with space.java': java('S'),
+                                      'dir/C.java': java('C')})
+    blobs = BlobReader()
+    try:
+        for name in ['new\nline.java', 'A.java', 'no\nsuch\nfile.java',
+                     'missing one', 'B.java', 'dir', 'with space.java',
+                     'dir/C.java']:
+            blob, content = blobs.read(head, name)
+            if name in ('no\nsuch\nfile.java', 'missing one', 'dir'):
+                assert (blob, content) == (None, None)
+                continue
+            expected = git(repo, 'rev-parse', '%s:%s' % (head, name)).strip()
+            assert blob == expected
+            assert content.decode('utf-8') == git(repo, 'cat-file', 'blob',
+                                                  expected)
+    finally:
+        blobs.close()
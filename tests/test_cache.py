@@ -0,0 +1,58 @@
+import json
+
+from git_jdime import ResultCache
+
+
+def total(cache):
+    db = cache.connect()
+    return (db.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0],
+            db.execute('SELECT SUM(size) FROM results').fetchone()[0])
+
+
+def test_hit_and_miss(tmp_path):
+    outfile = tmp_path / 'merged.java'
+    outfile.write_bytes(b'class A {}\n')
+    cache = ResultCache(str(tmp_path / 'cache'), 1 << 20, '1.0', None,
+                        output=True)
+    blobs = ['a' * 40, 'b' * 40, 'c' * 40]
+    assert cache.get(blobs, 'linebased') == (None, None)
+    cache.put(blobs, 'linebased', {'conflicts': 0}, str(outfile))
+    assert cache.get(blobs, 'linebased') == ({'conflicts': 0},
+                                             b'class A {}\n')
+    assert cache.get(blobs, 'structured') == (None, None)
+    assert cache.get(blobs[::-1], 'linebased') == (None, None)
+    # another jdime version does not find the results of this one
+    other = ResultCache(str(tmp_path / 'cache'), 1 << 20, '2.0', None)
+    assert other.get(blobs, 'linebased') == (None, None)
+    assert cache.counts == {'hits': 1, 'misses': 3}
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), 1000, '1.0', None)
+    result = {'padding': 'x' * 185}
+    size = len(json.dumps(result))
+    assert size == 200
+    for i in range(4):
+        cache.put([str(i)], 'linebased', result, None)
+    # the first result was used last, so the second one is the oldest
+    assert cache.get(['0'], 'linebased')[0] == result
+    cache.put(['0'], 'linebased', result, None)
+    assert total(cache) == (4 * size, 4 * size)
+
+    # 1200 bytes, evicted down to at most 900
+    cache.put(['4'], 'linebased', result, None)
+    cache.put(['5'], 'linebased', result, None)
+    assert total(cache) == (4 * size, 4 * size)
+    assert cache.get(['1'], 'linebased') == (None, None)
+    assert cache.get(['2'], 'linebased') == (None, None)
+    for i in (0, 3, 4, 5):
+        assert cache.get([str(i)], 'linebased')[0] == result
+
+
+def test_size_of_older_caches(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), 1000, '1.0', None)
+    cache.put(['0'], 'linebased', {}, None)
+    db = cache.connect()
+    db.execute('DROP TABLE meta')
+    cache.close()
+    assert total(cache) == (2, 2)
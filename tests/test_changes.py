@@ -0,0 +1,30 @@
+from conftest import commit, git, java
+
+from git_preparemerge import get_changes
+
+ODD = ['with space.java', 'tab\there.java', 'new\nline.java', 'quote"d.java',
+       'ünïcödé.java', '-dash.java']
+
+
+def test_changes(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    long = java('Long', *('field%d' % i for i in range(20)))
+    base = commit(repo, 'odd paths', dict({name: java('X', 'a') for name in ODD},
+                                          **{'old name.java': long,
+                                             'gone.java': java('Gone')}))
+    git(repo, 'checkout', '-q', '-b', 'left')
+    git(repo, 'rm', '-q', 'old name.java', 'gone.java')
+    left = commit(repo, 'left', dict({name: java('X', 'b') for name in ODD},
+                                     **{'add\ned.java': java('Added'),
+                                        'dir with space/ré\tnamed.java': long}))
+    git(repo, 'checkout', '-q', '-b', 'right', base)
+    right = commit(repo, 'right', {'other.java': java('Other')})
+
+    # the changes of the second commit since the merge base
+    files, new, renamed = get_changes(right, left)
+    assert files == set(ODD) | {'add\ned.java'}
+    assert new == {'add\ned.java'}
+    assert renamed == {'dir with space/ré\tnamed.java': 'old name.java'}
+
+    files, new, renamed = get_changes(left, right)
+    assert (files, new, renamed) == ({'other.java'}, {'other.java'}, {})
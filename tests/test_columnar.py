@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from conftest import ROOT, commit, git, java
+from test_coordinator import free_port
+
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+from aggregate import get_files, load
+from git_jdime import OUTPUTCOLS, TEXTCOLS
+
+
+@pytest.mark.parametrize('jobs', ['1', '2', 'workers'])
+def test_columnar_matches_csv(repo, fakebin, tmp_path, jobs):
+    # file names that csv has to quote
+    names = ['C;1.java', 'D\n2.java']
+    git(repo, 'checkout', '-q', '-b', 'base2', 'main')
+    commit(repo, 'quoted', {name: java('C', 'a', 'b', 'c', 'd')
+                            for name in names})
+    git(repo, 'checkout', '-q', '-b', 'side2')
+    commit(repo, 'side2', {name: java('C', 'a1', 'b', 'c', 'd')
+                           for name in names})
+    git(repo, 'checkout', '-q', 'base2')
+    commit(repo, 'main2', {name: java('C', 'a', 'b', 'c', 'd2')
+                           for name in names})
+    git(repo, 'merge', '-q', '--no-ff', '-m', 'merge side2', 'side2')
+
+    columnar = tmp_path / 'columnar'
+    script = os.path.join(ROOT, 'git_jdime.py')
+    args = [sys.executable, script, '-c', '-H', '-m', 'linebased,structured',
+            '--columnar', str(columnar)]
+    if jobs == 'workers':
+        # rows of workers reach the sink through the coordinator
+        address = '127.0.0.1:%d' % free_port()
+        args += ['-o', str(tmp_path / 'out'), '--coordinator', address]
+    else:
+        args += ['-J', jobs]
+    proc = subprocess.Popen(args + ['all'], cwd=repo,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True)
+    while jobs == 'workers' and proc.poll() is None:
+        time.sleep(0.5)
+        subprocess.run([sys.executable, script, '-o', str(tmp_path / 'work'),
+                        '--worker', address], capture_output=True, timeout=60)
+    out, err = proc.communicate(timeout=60)
+    assert proc.returncode == 0, err
+    path = tmp_path / 'out.csv'
+    path.write_text(out)
+
+    expected = load(get_files([str(path)]), OUTPUTCOLS)
+    actual = load(get_files([str(columnar)]), OUTPUTCOLS)
+    assert set(expected['file']) >= set(names)
+    for data in (expected, actual):
+        order = np.lexsort((data['strategy'], data['file'],
+                            data['mergecommit']))
+        for col in OUTPUTCOLS:
+            data[col] = data[col][order]
+    for col in OUTPUTCOLS:
+        if col in TEXTCOLS:
+            assert list(actual[col]) == list(expected[col]), col
+        else:
+            np.testing.assert_array_equal(actual[col], expected[col],
+                                          err_msg=col)
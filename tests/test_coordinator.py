@@ -0,0 +1,112 @@
+import base64
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+from conftest import ROOT, commit, git
+
+from git_jdime import OUTPUTCOLS, TIMEOUTCOLS, Repetitions, get_address
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_skipped_only_commit_is_complete(repo, fakebin, tmp_path):
+    # a merge commit without any java file to merge
+    git(repo, 'checkout', '-q', '-b', 'docs')
+    commit(repo, 'docs', {'README': 'docs\n'})
+    git(repo, 'checkout', '-q', 'main')
+    commit(repo, 'notes', {'NOTES': 'notes\n'})
+    git(repo, 'merge', '-q', '--no-ff', '-m', 'merge docs', 'docs')
+    merges = git(repo, 'rev-list', '--merges', 'HEAD').split()
+
+    state = tmp_path / 'state'
+    address = '127.0.0.1:%d' % free_port()
+    script = os.path.join(ROOT, 'git_jdime.py')
+    coordinator = subprocess.Popen([sys.executable, script, '-c', '-m',
+                                    'linebased', '-s', str(state), '-o',
+                                    str(tmp_path / 'out'), '--coordinator',
+                                    address, 'all'],
+                                   cwd=repo, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, text=True)
+    workers = []
+    while coordinator.poll() is None and len(workers) < 20:
+        # workers exit right away until the coordinator listens
+        time.sleep(0.5)
+        workers.append(subprocess.run([sys.executable, script, '-o',
+                                       str(tmp_path / 'work'), '--worker',
+                                       address], capture_output=True,
+                                      timeout=60))
+    out, err = coordinator.communicate(timeout=60)
+    assert coordinator.returncode == 0, err
+
+    db = sqlite3.connect(str(state / 'state.sqlite'))
+    complete = {merge for merge, in db.execute(
+        "SELECT merge FROM done WHERE file = '' AND strategy = 'linebased'")}
+    assert complete == set(merges)
+
+
+def test_address():
+    assert get_address('9123') == ('127.0.0.1', 9123)
+    assert get_address('0.0.0.0:9123') == ('0.0.0.0', 9123)
+    assert get_address('host:9123') == ('host', 9123)
+
+
+def test_worker_runs_jdime_only(fakebin, tmp_path):
+    # a coordinator that hands out a job with a command of its own
+    pwned = tmp_path / 'pwned'
+    target = '/elsewhere/scenario'
+    inputs = ['%s/%s/A.java' % (target, side)
+              for side in ('left', 'base', 'right')]
+    job = ['project', '0', 'merge', 'left', 'right', 'A.java', '3-way',
+           'linebased', target,
+           'mkdir -p %s %s %s %s %s %s %s/$$STRATEGY$$/A.java' %
+           ((pwned,) * 6 + (target,)), 10]
+    files = {os.path.relpath(path, target):
+             base64.b64encode(b'class A {}\n').decode('ascii')
+             for path in inputs}
+    config = {'jdimeversion': 'fake', 'jdimeopts': None,
+              'columns': OUTPUTCOLS + TIMEOUTCOLS,
+              'runs': vars(Repetitions()),
+              'timeouts': {'limit': 60, 'minimum': 1, 'factor': None,
+                           'perloc': None, 'slow': 'run'},
+              'trace': False, 'isolation': None}
+    leases = [{'lease': 1, 'ttl': 60, 'config': config, 'job': job,
+               'blobs': None, 'paths': inputs, 'files': files, 'slow': {},
+               'extra': {}}]
+    results = []
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            message = json.loads(self.rfile.readline())
+            answer = {}
+            if message['op'] == 'lease':
+                answer = leases.pop() if leases else {'done': True}
+            elif message['op'] == 'result':
+                results.append(message)
+            self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+
+    with socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler) as server:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            proc = subprocess.run([sys.executable,
+                                   os.path.join(ROOT, 'git_jdime.py'), '-o',
+                                   str(tmp_path / 'work'), '--worker',
+                                   str(server.server_address[1])],
+                                  capture_output=True, text=True, timeout=60)
+        finally:
+            server.shutdown()
+            thread.join()
+    assert proc.returncode == 0, proc.stderr
+    assert not pwned.exists()
+    assert results[0]['success'] and results[0]['completed'] == ['linebased']
@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT, git_jdime
+
+
+def test_isolate(repo, fakebin, tmp_path):
+    core = min(os.sched_getaffinity(0))
+    rows = git_jdime(repo, '-m', 'linebased', '-o', str(tmp_path / 'out'),
+                     '--isolate', str(core), '--nice', '5', '--max-busy',
+                     '100', 'all')
+    assert {row['file'] for row in rows} == {'A.java', 'B.java'}
+    assert all(row['env'] for row in rows)
+
+
+def test_more_jobs_than_cores(repo, tmp_path):
+    core = min(os.sched_getaffinity(0))
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, 'git_jdime.py'),
+                           '-o', str(tmp_path / 'out'), '-J', '2',
+                           '--isolate', str(core), 'all'], cwd=repo,
+                          capture_output=True, text=True)
+    assert proc.returncode == 2
+    assert 'more workers than cores' in proc.stderr
@@ -0,0 +1,81 @@
+import itertools
+import random
+import subprocess
+
+import pytest
+
+from conftest import git
+
+from git_preparemerge import CommitGraph
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    """Return a function that builds a history from a list of parent lists.
+
+    Each entry holds the indices of the parents of a commit, which are
+    listed before it. All commits are returned, in the order given.
+    """
+    path = tmp_path / 'dag'
+    path.mkdir()
+    git(path, 'init', '-q')
+    git(path, 'config', 'user.name', 'test')
+    git(path, 'config', 'user.email', 'test@example.com')
+    monkeypatch.chdir(path)
+    tree = git(path, 'mktree').strip()
+
+    def build(history):
+        commits = []
+        for i, parents in enumerate(history):
+            args = ['commit-tree', tree, '-m', str(i)]
+            for parent in parents:
+                args += ['-p', commits[parent]]
+            commits.append(git(path, *args).strip())
+            git(path, 'update-ref', 'refs/heads/c%d' % i, commits[-1])
+        return commits
+
+    return build
+
+
+def check(commits):
+    graph = CommitGraph()
+    for left, right in itertools.combinations(commits, 2):
+        # git exits with 1 if there is no merge base
+        expected = subprocess.run(['git', 'merge-base', '--all', left, right],
+                                  capture_output=True, text=True).stdout.split()
+        assert sorted(graph.merge_bases(left, right)) == sorted(expected)
+        assert sorted(graph.merge_bases(right, left)) == sorted(expected)
+
+
+def test_criss_cross(graph):
+    #   1 - 3 - 5
+    #  /  X   X
+    # 0 - 2 - 4 - 6
+    commits = graph([[], [0], [0], [1, 2], [2, 1], [3, 4], [4, 3]])
+    check(commits)
+    g = CommitGraph()
+    assert sorted(g.merge_bases(commits[3], commits[4])) == \
+        sorted([commits[1], commits[2]])
+    assert sorted(g.merge_bases(commits[5], commits[6])) == \
+        sorted([commits[3], commits[4]])
+
+
+def test_three_way_criss_cross(graph):
+    # three branches that each merge the other two
+    check(graph([[], [0], [0], [0], [1, 2], [2, 3], [3, 1], [4, 5], [5, 6],
+                 [6, 4]]))
+
+
+def test_unrelated(graph):
+    commits = graph([[], [], [0], [1], [2, 3]])
+    check(commits)
+    assert CommitGraph().merge_bases(commits[0], commits[1]) == []
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random(graph, seed):
+    rng = random.Random(seed)
+    history = [[]]
+    for i in range(1, 30):
+        parents = rng.sample(range(max(0, i - 6), i), min(i, rng.choice([1, 2])))
+        history.append(parents)
+    check(graph(history))
@@ -0,0 +1,19 @@
+from conftest import commit, git
+
+from git_preparemerge import find_merge
+
+
+def test_find_merge(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    merge, left, right = git(repo, 'log', '-n1', '--pretty=%H %P').split()
+    assert find_merge(left, right) == merge
+    assert find_merge(right, left) is None
+
+    # merges added later are found with an incremental update
+    git(repo, 'checkout', '-q', '-b', 'other', left)
+    other = commit(repo, 'other', {'C.java': 'class C {}\n'})
+    git(repo, 'checkout', '-q', 'main')
+    git(repo, 'merge', '-q', '--no-ff', '-m', 'merge other', 'other')
+    head = git(repo, 'rev-parse', 'HEAD').strip()
+    assert find_merge(merge, other) == head
+    assert find_merge(left, right) == merge
@@ -0,0 +1,38 @@
+import pytest
+
+from conftest import commit, git, git_jdime, java
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+@pytest.mark.parametrize('failing, pruned', [('A.java', 'sub/A.java'),
+                                             ('sub/A.java', 'A.java')])
+def test_prune_keeps_failed_scenario(repo, fakebin, tmp_path, jobs, failing,
+                                     pruned):
+    # two files that end in the same path, on both sides of a merge
+    git(repo, 'checkout', '-q', '-b', 'base2', 'main')
+    commit(repo, 'sub', {'sub/A.java': java('A', 'a', 'b', 'c', 'd')})
+    git(repo, 'checkout', '-q', '-b', 'side2')
+    commit(repo, 'side2', {'A.java': java('A', 'a3', 'b', 'c', 'd'),
+                           'sub/A.java': java('A', 'a3', 'b', 'c', 'd')})
+    git(repo, 'checkout', '-q', 'base2')
+    commit(repo, 'main2', {'A.java': java('A', 'a1', 'b', 'c', 'd4'),
+                           'sub/A.java': java('A', 'a', 'b', 'c', 'd4')})
+    git(repo, 'merge', '-q', '--no-ff', '-m', 'merge side2', 'side2')
+    merge = git(repo, 'rev-parse', 'HEAD').strip()
+
+    out = tmp_path / 'out'
+    rows = git_jdime(repo, '-m', 'linebased,structured', '-o', str(out), '-p',
+                     '-J', jobs, merge,
+                     env={'FAKE_FAIL': 'structured/' + failing})
+    status = {(row['file'], row['strategy']): row['status'] for row in rows}
+    assert status == {(failing, 'linebased'): 'ok',
+                      (failing, 'structured'): 'failed',
+                      (pruned, 'linebased'): 'ok',
+                      (pruned, 'structured'): 'ok'}
+
+    target = out / merge
+    for side in ('left', 'base', 'right', 'linebased'):
+        assert (target / side / failing).exists()
+        assert not (target / side / pruned).exists()
+    assert not (target / 'structured' / pruned).exists()
+    assert (target / 'error.log').exists()
@@ -0,0 +1,11 @@
+from git_jdime import Repetitions
+
+
+def test_repetitions():
+    repetitions = Repetitions(runs=10, ciwidth=0.05)
+    assert not repetitions.enough([1.0, 1.0])
+    assert repetitions.enough([1.0, 1.0, 1.0])
+    # a half width of t(0.975, 2) * 0.1 / sqrt(3) = 0.248, 12.4 % of the mean
+    assert not repetitions.enough([1.9, 2.0, 2.1])
+    assert Repetitions(runs=10, ciwidth=0.125).enough([1.9, 2.0, 2.1])
+    assert Repetitions(runs=3).enough([1.0, 5.0, 9.0])
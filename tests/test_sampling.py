@@ -0,0 +1,19 @@
+import pytest
+
+from git_jdime import sample_size
+
+
+@pytest.mark.parametrize('population, fraction, precision, confidence, n', [
+    # the textbook sizes for +/- 5 % at 95 % confidence
+    (10 ** 9, None, 0.05, 0.95, 385),
+    (1000, None, 0.05, 0.95, 278),
+    (100, None, 0.05, 0.95, 80),
+    (10 ** 9, None, 0.01, 0.99, 16587),
+    (55, 0.1, None, 0.95, 6),
+    (1000, 0.5, 0.05, 0.95, 500),
+    (1000, 0.01, None, 0.95, 10),
+    (10, 0.01, None, 0.95, 2),
+    (1, 0.5, None, 0.95, 1),
+])
+def test_sample_size(population, fraction, precision, confidence, n):
+    assert sample_size(population, fraction, precision, confidence) == n
@@ -0,0 +1,68 @@
+from git_jdime import scan_output
+
+MERGED = b'''class A {
+<<<<<<< left.java
+  int a1;
+  int b1;
+=======
+  int a2;
+>>>>>>> right.java
+  int c;
+<<<<<<< left.java
+=======
+  void f() {}
+  void g() {}
+>>>>>>> right.java
+  // ======= not a marker
+}
+'''
+
+DIFF3 = b'''class A {
+<<<<<<< left.java
+  int a1;
+||||||| base.java
+  int a;
+  int b;
+=======
+  int a2;
+  int b2;
+  int c2;
+>>>>>>> right.java
+}'''
+
+
+def scan(tmp_path, content):
+    path = tmp_path / 'merged.java'
+    path.write_bytes(content)
+    return scan_output(str(path))
+
+
+def test_conflicts(tmp_path):
+    assert scan(tmp_path, MERGED) == {'parsed_conflicts': 2, 'loc_out': 15,
+                                      'cleft': 2, 'cright': 3,
+                                      'csizes': '2/1,0/2'}
+
+
+def test_base_section(tmp_path):
+    # the lines of the base are in neither half, the last line has no newline
+    assert scan(tmp_path, DIFF3) == {'parsed_conflicts': 1, 'loc_out': 11,
+                                     'cleft': 1, 'cright': 3, 'csizes': '1/3'}
+
+
+def test_clean(tmp_path):
+    assert scan(tmp_path, b'class A {}\n') == {'parsed_conflicts': 0,
+                                               'loc_out': 1, 'cleft': 0,
+                                               'cright': 0, 'csizes': ''}
+
+
+def test_unbalanced(tmp_path):
+    # an unterminated conflict is not counted
+    assert scan(tmp_path, MERGED + b'<<<<<<< left.java\n  int x;\n') == \
+        {'parsed_conflicts': 2, 'loc_out': 17, 'cleft': 2, 'cright': 3,
+         'csizes': '2/1,0/2'}
+
+
+def test_missing(tmp_path):
+    assert scan_output(str(tmp_path / 'missing.java')) == \
+        {'parsed_conflicts': 0, 'loc_out': 0, 'cleft': 0, 'cright': 0,
+         'csizes': ''}
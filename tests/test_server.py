@@ -0,0 +1,42 @@
+from conftest import git_jdime
+
+
+def test_server(repo, fakebin, tmp_path):
+    rows = git_jdime(repo, '-m', 'linebased,structured', '-o',
+                     str(tmp_path / 'out'), '-r', '2', '--server',
+                     'jdime-server', 'all')
+    assert [(row['file'], row['strategy'], row['jvm']) for row in rows
+            if row['mergetype'] != 'skipped'] == \
+        [(row['file'], row['strategy'], 'mixed' if i == 0 else 'warm')
+         for i, row in enumerate(rows)]
+    assert {row['conflicts'] for row in rows
+            if row['file'] == 'A.java'} == {'1'}
+
+
+def test_server_warmup(repo, fakebin, tmp_path):
+    rows = git_jdime(repo, '-m', 'linebased', '-o', str(tmp_path / 'out'),
+                     '--server', 'jdime-server', '--server-warmup', '1', 'all')
+    assert [row['jvm'] for row in rows] == ['warm', 'warm']
+
+
+def test_server_timeout(repo, fakebin, tmp_path):
+    # a timeout kills the server, the next merge starts a cold one
+    rows = git_jdime(repo, '-m', 'linebased,structured', '-o',
+                     str(tmp_path / 'out'), '--timeout', '1', '--server',
+                     'jdime-server', 'all', env={'FAKE_SLOW': '3'})
+    jvm = {(row['file'], row['strategy']): (row['jvm'], row['status'])
+           for row in rows}
+    for file in ('A.java', 'B.java'):
+        assert jvm[(file, 'linebased')] == ('cold', 'ok')
+        assert jvm[(file, 'structured')] == ('warm', 'timeout')
+
+
+def test_server_parallel(repo, fakebin, tmp_path):
+    # every worker starts a server of its own
+    rows = git_jdime(repo, '-m', 'linebased,structured', '-o',
+                     str(tmp_path / 'out'), '-J', '2', '--server',
+                     'jdime-server', 'all')
+    assert len(rows) == 4
+    assert {row['jvm'] for row in rows} <= {'cold', 'warm'}
+    assert {row['conflicts'] for row in rows
+            if row['file'] == 'A.java'} == {'1'}
@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+import pytest
+
+import jdime_stats
+from jdime_stats import betainc, t_quantile, t_sf, t_sf_array
+
+
+@pytest.mark.parametrize('df, quantile', [(1, 12.7062047362), (2, 4.3026527297),
+                                          (4, 2.7764451052), (10, 2.2281388520),
+                                          (30, 2.0422724563)])
+def test_t_quantile_table(df, quantile):
+    assert t_quantile(0.975, df) == pytest.approx(quantile, rel=1e-9)
+    assert t_quantile(0.025, df) == pytest.approx(-quantile, rel=1e-9)
+
+
+@pytest.mark.parametrize('p', [0.9, 1 - 2.5e-5, 1 - 2.5e-6, 1 - 1e-9])
+def test_t_quantile_tails(p):
+    # closed forms for one and two degrees of freedom
+    assert t_quantile(p, 1) == pytest.approx(math.tan(math.pi * (p - 0.5)),
+                                             rel=1e-6)
+    assert t_quantile(p, 2) == pytest.approx((2 * p - 1) /
+                                             math.sqrt(2 * p * (1 - p)),
+                                             rel=1e-6)
+
+
+@pytest.mark.parametrize('t', [0.5, 3, 30, 300])
+def test_t_sf_four_degrees(t):
+    # closed form of the cdf for four degrees of freedom
+    s = t / math.sqrt(4 + t * t)
+    assert t_sf(t, 4) == pytest.approx((1 - 1.5 * s + 0.5 * s ** 3) / 2,
+                                       rel=1e-6)
+    assert t_sf(-t, 4) == pytest.approx(1 - t_sf(t, 4))
+
+
+def test_betainc():
+    assert betainc(1, 1, 0.3) == pytest.approx(0.3)
+    assert betainc(2, 3, 0.4) == pytest.approx(0.5248)
+    assert betainc(2, 3, 0) == 0
+    assert betainc(2, 3, 1) == 1
+
+
+@pytest.mark.parametrize('scipy', [False, True])
+def test_t_sf_array(monkeypatch, scipy):
+    if scipy:
+        pytest.importorskip('scipy')
+    else:
+        monkeypatch.setattr(jdime_stats, 'special', None)
+    t = np.array([0.5, -2.0, 3.0, 30.0, 0.0, np.inf, np.nan, 1.0])
+    df = np.array([4.0, 2.5, 1.0, 170.3, 7.0, 3.0, 3.0, np.nan])
+    expected = [t_sf(x, n) for x, n in zip(t[:5], df[:5])] + [0.0]
+    result = t_sf_array(t, df)
+    assert result[:6] == pytest.approx(expected, rel=1e-9, abs=1e-300)
+    assert np.isnan(result[6:]).all()
@@ -0,0 +1,42 @@
+from conftest import git_jdime
+
+from git_jdime import Timeouts
+
+
+def test_predict():
+    timeouts = Timeouts(limit=100, minimum=5, factor=10, perloc=0.5)
+    assert timeouts.predict('linebased', 4, {}) == 5
+    assert timeouts.predict('structured', 100, {'linebased': 2}) == 50
+    assert timeouts.predict('structured', 10, {'linebased': 3}) == 30
+    assert timeouts.predict('structured', 1000, {}) == 100
+
+
+def test_known_slow():
+    assert Timeouts(slow='run').predict('structured', 10, {}, 60) == 1800
+    assert Timeouts(slow='skip').predict('structured', 10, {}, 60) is None
+    assert Timeouts(minimum=5, slow='cap').predict('structured', 10, {},
+                                                   60) == 5
+
+
+def test_timeout_then_skip(repo, fakebin, tmp_path):
+    state = str(tmp_path / 'state')
+    args = ['-m', 'linebased,structured', '-s', state, '--timeout', '1',
+            '--min-timeout', '1']
+    env = {'FAKE_SLOW': '3'}
+
+    rows = git_jdime(repo, '-o', str(tmp_path / 'out1'), *args, 'all',
+                     env=env)
+    status = {(row['file'], row['strategy']): row['status'] for row in rows}
+    assert status[('A.java', 'structured')] == 'timeout'
+    assert status[('A.java', 'linebased')] == 'ok'
+
+    rows = git_jdime(repo, '-o', str(tmp_path / 'out2'), '--known-slow',
+                     'skip', *args, 'all', env=env)
+    assert sorted((row['file'], row['strategy'], row['status'])
+                  for row in rows if row['mergetype'] != 'skipped') == \
+        [('A.java', 'structured', 'slow'), ('B.java', 'structured', 'slow')]
+
+    # the merge commit is complete now
+    rows = git_jdime(repo, '-o', str(tmp_path / 'out3'), '--known-slow',
+                     'skip', *args, 'all', env=env)
+    assert rows == []
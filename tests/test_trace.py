@@ -0,0 +1,44 @@
+import json
+
+from git_preparemerge import Tracer
+
+
+def test_trace_is_streamed(tmp_path):
+    path = tmp_path / 'trace.json'
+    tracer = Tracer()
+    tracer.enable(str(path))
+    with tracer.span('git diff', 'git'):
+        pass
+    tracer.add([{'name': 'jdime', 'cat': 'jdime', 'ph': 'X', 'ts': 0,
+                 'dur': 2e6, 'pid': 1, 'tid': 1, 'args': {}}])
+    # readable before the end, like the trace of a killed run
+    events = json.loads(path.read_text() + ']')
+    assert [event['name'] for event in events] == ['git diff', 'jdime']
+    assert tracer.take() == []
+    tracer.close()
+    assert len(json.loads(path.read_text())) == 2
+    assert tracer.phases['jdime'] == [1, 2.0]
+    assert tracer.jdime == {1: 2.0}
+
+
+def test_trace_lines(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    tracer = Tracer()
+    tracer.enable(str(path))
+    for i in range(3):
+        with tracer.span('parse', 'parse', i=i):
+            pass
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)['args']['i'] for line in lines] == [0, 1, 2]
+
+
+def test_trace_kept_without_file():
+    tracer = Tracer()
+    with tracer.span('parse', 'parse'):
+        pass
+    assert tracer.take() == []
+    tracer.enable()
+    with tracer.span('parse', 'parse'):
+        pass
+    assert [event['name'] for event in tracer.take()] == ['parse']
+    assert tracer.take() == []